@@ -115,6 +115,7 @@ class AccuRev(object):
         self.username = username
         self.password = password
         self.executable = executable
+        self.timings = Timings()
  
     def _cmd(self, args, check_rc=False):
         owd = os.getcwd()
@@ -122,7 +123,7 @@ class AccuRev(object):
  
         command = [self.executable]
         command.extend(args)
-        rc, out, err = self.module.run_command(command, check_rc)
+        rc, out, err = self.timings.run(self.module, command, name='accurev %s' % (args[0]), check_rc=check_rc)
  
         os.chdir(owd)
         return (rc, out, err)
@@ -134,7 +135,7 @@ class AccuRev(object):
         return True
  
     def create(self):
-        cmd = AccuRev.commands[self.stream_type]['create']
+        cmd = list(AccuRev.commands[self.stream_type]['create'])
         cmd.extend([self.name, '-b', self.stream, '-l', '.'])
         rc, out, err = self._cmd(cmd)
         if "already" in err:
@@ -143,7 +144,7 @@ class AccuRev(object):
                 raise Exception("Unable to create nor change the workspace/reftree.")
  
     def change(self):
-        cmd = AccuRev.commands[self.stream_type]['change']
+        cmd = list(AccuRev.commands[self.stream_type]['change'])
         cmd.extend([self.name, '-b', self.stream, '-l', '.'])
         return self._cmd(cmd)
  
@@ -154,8 +155,8 @@ class AccuRev(object):
         self._cmd(['pop', '-R', '-O', '.'], True)
  
     def remove(self):
-        cmd = ['remove'].extend(AccuRev.commands[self.stream_type]['remove'])
-        cmd.extend(self.name)
+        cmd = ['remove'] + AccuRev.commands[self.stream_type]['remove']
+        cmd.append(self.name)
         rc, out, err = self._cmd(cmd)
         if rc != 0:
             raise Exception("Unable to remove the workspace/reftree.")
@@ -205,7 +206,9 @@ def main():
     else:
         accurev.create()
         accurev.update(force)
-    module.exit_json(changed=True, dest=dest, stream_type=stream_type, state=state)
+    module.exit_json(changed=True, dest=dest, stream_type=stream_type, state=state, timings=accurev.timings.summary())
  
 from ansible.module_utils.basic import *
-main()
+from ansible.module_utils.timings import Timings
+if __name__ == '__main__':
+    main()
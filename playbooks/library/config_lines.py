@@ -0,0 +1,149 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+
+DOCUMENTATION = '''
+---
+module: config_lines
+short_description: Ensures several lines are in a file in a single pass.
+description:
+   - Applies a set of lineinfile-like rules to a file with one read, one
+     pass in memory and one atomic write.
+   - For each rule, the last line matching C(regexp) is replaced with
+     C(line). If nothing matches, C(line) is inserted after the last line
+     matching C(insertafter), or at the end of the file.
+version_added: "1.0"
+options:
+  dest:
+    description:
+      - The file to modify.
+    required: true
+  lines:
+    description:
+      - Map of rule name to a dict with C(line) and, optionally, C(regexp)
+        and C(insertafter). Without C(regexp) the rule matches C(line)
+        literally. Lines inserted after the same anchor keep the order the
+        rules are given in.
+    required: true
+'''
+
+EXAMPLES = '''
+# Set several elasticsearch options at once
+- config_lines:
+    dest: /opt/elasticsearch/config/elasticsearch.yml
+    lines:
+      network.host: { regexp: '^network.host', insertafter: '^#network.host', line: 'network.host: 0.0.0.0' }
+      cluster.name: { regexp: '^cluster.name', insertafter: '^#cluster.name', line: 'cluster.name: example' }
+'''
+
+import os
+import re
+import tempfile
+
+
+class Rule(object):
+
+    def __init__(self, key, line, regexp=None, insertafter=None):
+        self.key = key
+        self.line = line
+        self.regexp = re.compile(regexp) if regexp else None
+        self.insertafter = re.compile(insertafter) if insertafter and insertafter != 'EOF' else None
+        self.match = None
+        self.anchor = None
+
+    def scan(self, index, line):
+        if self.regexp is not None:
+            if self.regexp.search(line):
+                self.match = index
+        elif line == self.line:
+            self.match = index
+        if self.insertafter is not None and self.insertafter.search(line):
+            self.anchor = index
+
+
+def apply_rules(lines, rules):
+    # A single scan records, for every rule, its last match and anchor
+    stripped = [l.rstrip('\r\n') for l in lines]
+    for index, line in enumerate(stripped):
+        for rule in rules:
+            rule.scan(index, line)
+
+    changed = []
+    inserts = []
+    for rule in rules:
+        if rule.match is not None:
+            if stripped[rule.match] != rule.line:
+                lines[rule.match] = rule.line + '\n'
+                changed.append(rule.key)
+        else:
+            position = len(lines) if rule.anchor is None else rule.anchor + 1
+            inserts.append((position, len(inserts), rule))
+            changed.append(rule.key)
+
+    # Insert from the bottom up so the recorded positions stay valid,
+    # rules sharing an anchor keep the order they were given in
+    for position, _, rule in sorted(inserts, key=lambda i: i[:2], reverse=True):
+        if position == len(lines) and lines and not lines[-1].endswith('\n'):
+            lines[-1] += '\n'
+        lines.insert(position, rule.line + '\n')
+    return changed
+
+
+def main():
+
+    module = AnsibleModule(
+        argument_spec = dict(
+            dest = dict(type='path', required=True, aliases=['path']),
+            lines = dict(type='dict', required=True),
+        ),
+        supports_check_mode=True
+    )
+
+    dest = module.params["dest"]
+
+    # Sanity check
+    if not os.path.isfile(dest):
+        module.fail_json(msg="Dest parameter (%s) must be an existing file." % (dest))
+
+    rules = []
+    # In the order they were given, that's the order of same anchor inserts
+    for key, spec in module.params["lines"].items():
+        if not isinstance(spec, dict) or 'line' not in spec:
+            module.fail_json(msg="Rule (%s) must be a dict with at least a line." % (key))
+        try:
+            rules.append(Rule(key, str(spec['line']), spec.get('regexp'), spec.get('insertafter')))
+        except re.error as e:
+            module.fail_json(msg="Rule (%s) has an invalid regular expression: %s" % (key, e))
+
+    with open(dest) as f:
+        lines = f.readlines()
+
+    changed = apply_rules(lines, rules)
+
+    if changed and not module.check_mode:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), prefix='.%s.' % (os.path.basename(dest)))
+        with os.fdopen(fd, 'w') as f:
+            f.writelines(lines)
+        # Keeps the ownership and mode of the original file
+        module.atomic_move(tmp, dest)
+
+    module.exit_json(changed=bool(changed), dest=dest, changed_keys=changed)
+
+# import module snippets
+from ansible.module_utils.basic import *
+if __name__ == '__main__':
+    main()
@@ -2,9 +2,11 @@
 # -*- coding: utf-8 -*-
 
 import os
+import time
 import shutil
-import subprocess
 import hashlib
+import collections
+from multiprocessing.pool import ThreadPool
 
 
 def string_in_file(path, needle):
@@ -14,87 +16,232 @@ def string_in_file(path, needle):
             if needle in line: return True
     return False
 
-def make_sshcfg(cfg, host, user, key):
+def make_sshcfg(sshconfig, host, user, key):
     with open(sshconfig, 'a') as cfg:
         cfg.write("""Host %s
     HostName %s
     User %s
     IdentityFile %s
     IdentitiesOnly yes
+    ControlMaster auto
+    ControlPath ~/.ssh/cm-%%r@%%h:%%p
+    ControlPersist 10m
 """ % (host, host, user, key))
 
 def digest(path):
     with open(path, 'rb') as f:
         return hashlib.sha1(f.read()).hexdigest()
 
+def is_bare_repo(path):
+    # The minimum layout git itself checks for before accepting a gitdir
+    return os.path.isfile(os.path.join(path, 'HEAD')) \
+        and os.path.isfile(os.path.join(path, 'config')) \
+        and os.path.isdir(os.path.join(path, 'objects'))
+
+def read_remote_url(path, name='origin'):
+    # Parse the git config file directly, spawning git for this is too slow
+    config = os.path.join(path, 'config')
+    if not os.path.isfile(config): return None
+    section = '[remote "%s"]' % (name)
+    in_section = False
+    with open(config) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('['):
+                in_section = line == section
+            elif in_section and '=' in line:
+                key, value = line.split('=', 1)
+                if key.strip() == 'url': return value.strip()
+    return None
+
+def parse_remote(remote):
+    # Only scp-like remotes (user@host:path) need an ssh config stanza
+    if '://' in remote or '@' not in remote or ':' not in remote:
+        return None, None
+    user, host = remote.split('@', 1)
+    host = host.split(':', 1)[0]
+    return user, host
+
+def git(timings, cwd, args):
+    returncode, _, _ = timings.call(["git"] + args, name="git %s" % (args[0]), cwd=cwd)
+    return returncode
+
+def ensure_privatekey(module, privatekey, projkey):
+    ssh_dir = os.path.dirname(projkey)
+    changed = False
+
+    if not os.path.isdir(ssh_dir):
+        changed = True
+        if not module.check_mode:
+            os.makedirs(ssh_dir)
+            os.chmod(ssh_dir, 0o700)
+
+    if not os.path.isfile(projkey) or digest(privatekey) != digest(projkey):
+        changed = True
+        if not module.check_mode:
+            # The previous copy is read-only, replace it instead of writing over it
+            if os.path.exists(projkey):
+                os.remove(projkey)
+            shutil.copyfile(privatekey, projkey)
+
+    if os.path.isfile(projkey) and os.stat(projkey).st_mode & 0o777 != 0o400:
+        changed = True
+        if not module.check_mode:
+            os.chmod(projkey, 0o400)
+
+    return changed
+
+def ensure_remote(module, timings, project_dir, remote):
+    current = read_remote_url(project_dir)
+    if current == remote:
+        return False
+    if module.check_mode:
+        return True
+
+    if current is None:
+        returncode = git(timings, project_dir, ["remote", "add", "origin", remote])
+    else:
+        returncode = git(timings, project_dir, ["remote", "set-url", "origin", remote])
+    if returncode > 0:
+        module.fail_json(msg="Unable to add remote repository (%s) to the existing git project (%s)." % (remote, project_dir))
+    return True
+
+
+def ensure_project(module, timings, rootdir, project, remote, privatekey):
+    project_dir = os.path.join(rootdir, project)
+    changed = False
+
+    if not is_bare_repo(project_dir):
+        changed = True
+        if module.check_mode:
+            # Nothing else can be inspected in a repository that doesn't exist yet
+            return changed
+        if not os.path.isdir(project_dir):
+            os.makedirs(project_dir)
+        returncode = git(timings, project_dir, ["init", "--bare"])
+        if returncode > 0:
+            module.fail_json(msg="Unable to create bare repository in directory (%s)." % (project_dir))
+
+    if remote:
+        user, host = parse_remote(remote)
+        if privatekey and host:
+            ssh_dir = os.path.join(os.path.expanduser('~'), ".ssh")
+            projkey = os.path.join(ssh_dir, project + '.privatekey')
+            changed = ensure_privatekey(module, privatekey, projkey) or changed
+
+            sshconfig = os.path.join(ssh_dir, 'config')
+            if not string_in_file(sshconfig, host):
+                changed = True
+                if not module.check_mode:
+                    make_sshcfg(sshconfig, host, user, projkey)
+
+        changed = ensure_remote(module, timings, project_dir, remote) or changed
+
+    return changed
+
+def disk_usage(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for f in files:
+            total += os.lstat(os.path.join(root, f)).st_size
+    return total
+
+def mirror(timings, project_dir):
+    # Heads and tags land directly in the bare repository, not under remotes/
+    objects = os.path.join(project_dir, 'objects')
+    before = disk_usage(objects)
+    start = time.time()
+    rc, out, err = timings.call(["git", "fetch", "--prune", "origin",
+                                 "+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"],
+                                name="git fetch", cwd=project_dir)
+    duration = time.time() - start
+    return dict(
+        rc=rc,
+        # Refs which are already up to date aren't reported without -v
+        changed=rc == 0 and ' -> ' in err,
+        duration=round(duration, 3),
+        bytes=disk_usage(objects) - before,
+        stderr=err.strip(),
+    )
+
+def parse_projects(module, project, projects, remote):
+    parsed = []
+    if project is not None:
+        parsed.append((project, remote))
+    for entry in projects or []:
+        if isinstance(entry, dict):
+            if 'name' not in entry:
+                module.fail_json(msg="Every entry in projects must have a name (%s)." % (entry))
+            parsed.append((entry['name'], entry.get('remote')))
+        else:
+            parsed.append((entry, None))
+    return parsed
+
 def main():
 
     module = AnsibleModule(
         argument_spec = dict(
             rootdir = dict(type='path', default=None),
             project = dict(default=None),
+            projects = dict(type='list', required=False, default=None),
             remote = dict(required=False, default=None),
             privatekey = dict(type='path', required=False, default=None),
-            state = dict(required=False, default='present'),
-        )
+            concurrency = dict(type='int', required=False, default=4),
+            state = dict(required=False, default='present', choices=['present', 'mirrored']),
+        ),
+        supports_check_mode=True
     )
 
     rootdir = module.params["rootdir"]
     project = module.params["project"]
+    projects = module.params["projects"]
     remote = module.params["remote"]
     privatekey = module.params["privatekey"]
+    concurrency = module.params["concurrency"]
     state = module.params["state"]
 
-    project_dir = os.path.join(rootdir, project)
-
     # Sanity check
     if not os.path.isdir(rootdir):
         module.fail_json(msg="Rootdir parameter (%s) must be a valid directory." % (rootdir))
-    if project is None:
+    if project is None and not projects:
         module.fail_json(msg="Project parameter (%s) is mandatory and a valid string." % (project))
     if privatekey is not None:
         if not os.path.isfile(privatekey):
             module.fail_json(msg="Privatekey must be a valid file with enough read permissions (%s)." % (privatekey))
-
-    if not os.path.isdir(project_dir):
-        os.makedirs(project_dir)
-
-    os.chdir(project_dir)
-    returncode = subprocess.call(["git", "init", "--bare"], stdout=subprocess.PIPE)
-    if returncode > 0:
-        module.fail_json(msg="Unable to create bare repository in directory (%s)." % (project_dir))
-
-    if remote:
-        ssh_dir = os.path.join(os.path.expanduser('~'), ".ssh")
-        projkey = os.path.join(ssh_dir, project + '.privatekey')
-
-        if privatekey and not os.path.exists(ssh_dir):
-            os.makedirs(ssh_dir)
-            os.chmod(ssh_dir, 0o700)
-
-        if os.path.isfile(projkey):
-            src = digest(privatekey)
-            dest = digest(projkey)
-            if src != dest:
-                shutil.copyfile(privatekey, projkey)
-        else:
-            shutil.copyfile(privatekey, projkey)
-        os.chmod(projkey, 0o400)
-
-        user, host = remote.split('@')
-        host, path = host.split(':')
-        sshconfig = os.path.join(ssh_dir, 'config')
-        if not string_in_file(sshconfig, host):
-            make_sshcfg(sshconfig, host, user, projkey)
-
-        noerror = subprocess.call(["git", "remote", "rm", "origin"], stdout=subprocess.PIPE)
-        returncode = subprocess.call(["git", "remote", "add", "origin", remote], stdout=subprocess.PIPE)
-        if returncode > 0:
-            module.fail_json(msg="Unable to add remote repository (%s) to the existing git project (%s)." % (remote, project_dir))
-
-    module.exit_json(changed=True, rootdir=rootdir, project=project, remote=remote, privatekey=privatekey)
+    if concurrency < 1:
+        module.fail_json(msg="The concurrency parameter must be greater than 0.")
+
+    timings = Timings()
+    results = collections.OrderedDict()
+    for name, url in parse_projects(module, project, projects, remote):
+        results[name] = dict(project=name, remote=url,
+                             changed=ensure_project(module, timings, rootdir, name, url, privatekey))
+
+    if state == 'mirrored' and not module.check_mode:
+        names = [n for n in results if read_remote_url(os.path.join(rootdir, n))]
+        pool = ThreadPool(min(concurrency, len(names) or 1))
+        try:
+            fetched = pool.map(lambda n: mirror(timings, os.path.join(rootdir, n)), names)
+        finally:
+            pool.close()
+            pool.join()
+
+        failed = []
+        for name, fetch in zip(names, fetched):
+            results[name]['fetch'] = fetch
+            results[name]['changed'] = results[name]['changed'] or fetch['changed']
+            if fetch['rc'] != 0:
+                failed.append(name)
+        if failed:
+            module.fail_json(msg="Unable to fetch the remote of project(s) (%s)." % (", ".join(failed)),
+                             projects=list(results.values()), timings=timings.summary())
+
+    changed = any(r['changed'] for r in results.values())
+    module.exit_json(changed=changed, rootdir=rootdir, project=project, remote=remote, privatekey=privatekey,
+                     state=state, projects=list(results.values()), timings=timings.summary())
 
 # import module snippets
 from ansible.module_utils.basic import *
+from ansible.module_utils.timings import Timings
 if __name__ == '__main__':
     main()
@@ -23,81 +23,344 @@ DOCUMENTATION = '''
 module: hammer
 short_description: Deploy a package to a Satellite 6 repository.
 description:
-   - Deploy a given RPM to a Satellite 6 repository using Hammer commands.
+   - Deploy the given RPMs to a Satellite 6 repository using Hammer commands.
+     All the packages are uploaded first, then every content view and
+     composite view involved is published exactly once.
 version_added: "1.0"
 author: "Joao Grilo (@jmgnm) <joao.grilo@gmail.com>"
+requirements:
+   - PyYAML
+options:
+  rpm:
+    description:
+      - List of RPM files (or shell globs) to upload.
+    required: true
+  name:
+    description:
+      - Name of the repository receiving the packages.
+    required: true
+  product:
+    description:
+      - Product the repository belongs to.
+    required: true
+  content_view:
+    description:
+      - List of content views holding the repository, each one is published
+        once after all the uploads are done.
+    required: true
+  composite_view:
+    description:
+      - List of composite views whose components should be moved to the newly
+        published content view versions. Each one is published once.
+    required: false
+    default: []
+  lifecycle_environment:
+    description:
+      - List of lifecycle environments to promote the composite views (or the
+        content views, if there are no composite views) to, in the order of
+        their lifecycle path.
+    required: false
+    default: []
+  concurrency:
+    description:
+      - Maximum number of simultaneous uploads.
+    required: false
+    default: 4
+  async_tasks:
+    description:
+      - If C(True), publish and promote are submitted with C(--async) and the
+        resulting Satellite tasks are polled together, so independent
+        publishes and promotions overlap instead of running one after the
+        other. Promotions of a view still follow the order of
+        C(lifecycle_environment), since Satellite refuses to promote out of
+        sequence, only different views are promoted at the same time.
+    required: false
+    default: "False"
+    choices: [ "True", "False" ]
+  task_timeout:
+    description:
+      - Seconds to wait for the asynchronous tasks of each step to finish.
+    required: false
+    default: 3600
+  use_sessions:
+    description:
+      - If C(True), authenticate once with C(hammer auth login) and run every
+        other command against that session instead of sending the credentials
+        each time. Falls back to per-command credentials if the login fails.
+    required: false
+    default: "True"
+    choices: [ "True", "False" ]
+  executable:
+    description:
+      - Path to the hammer executable to use. If not supplied, the normal
+        mechanism for resolving binary paths will be used.
+    required: false
+    default: null
 '''
 
 EXAMPLES = '''
-# Publish an rpm package in a composite content view
-- hammer: username=admin password=secret organization="ingdirect" product="f2e" name="f2e" content_view="RHEL6" lifecycle_environment="F2E server des" composite_view=True
+# Publish rpm packages in a composite content view
+- hammer: username=admin password=secret organization="ingdirect" product="f2e" name="f2e" rpm="/tmp/build/*.rpm" content_view="RHEL6" composite_view="F2E" lifecycle_environment="F2E server des"
+# Promote to several lifecycle environments at the same time
+- hammer: username=admin password=secret organization="ingdirect" product="f2e" name="f2e" rpm="/tmp/build/*.rpm" content_view="RHEL6" composite_view="F2E" lifecycle_environment="F2E server des,F2E server tst" async_tasks=True
 '''
 
 
 import os
+import re
+import glob
+import time
+import datetime
+import tempfile
+import itertools
+from multiprocessing.pool import ThreadPool
 
+try:
+    import yaml
+    HAS_YAML = True
+except ImportError:
+    HAS_YAML = False
 
-class Hammer:
 
-	def __init__(self, module, username, password, organization):
-		self.module = module
-		self.username = username
-		self.password = password
-		self.organization = organization
+class HammerError(Exception):
+    pass
 
-	def _cmd(self, args, check_rc=False):
-		rc, out, err = self.module.run_command(command, check_rc)
-		return (rc, out, err)
 
-	def _hammer(self, args):
-		command = 'hammer -u %s -p %s --output=yaml ' % (self.username, self.password)
-		command += args
-		command += ' --organization %s' % self.organization
-		return self._cmd(command)
+class Hammer(object):
 
-	def upload_content(rpm_path, name, product):
-		args = 'repository upload-content --path %s --name %s --product %s' % (rpm_path, organization, name, product)
-		rc, out, err = self._hammer(args)
-		return out
+    def __init__(self, module, username, password, organization, executable):
+        self.module = module
+        self.username = username
+        self.password = password
+        self.organization = organization
+        self.executable = executable
+        self.config = None
+        self.timings = Timings()
+        self._cache = {}
 
-	def publish(content_view):
-		args = 'content-view publish --name %s' % (content_view)
-		rc, out, err = self._hammer(args)
-		return out
+    def _cmd(self, command, check_rc=False, name=None):
+        rc, out, err = self.timings.run(self.module, command, name=name, check_rc=check_rc)
+        return (rc, out, err)
 
-	def version_list(content_view):
-		args = 'content-view version list --name %s' % (content_view)
-		rc, out, err = self._hammer(args)
-		return out
+    def _base(self):
+        if self.config:
+            return [self.executable, '-c', self.config]
+        return [self.executable, '-u', self.username, '-p', self.password]
 
-	def info(content_view):
-		args = 'content-view info --name %s' % (content_view)
-		rc, out, err = self._hammer(args)
-		return out
+    def _hammer(self, args, organization=True, threaded=False):
+        command = self._base() + ['--output=yaml']
+        command.extend(args)
+        if organization:
+            command.extend(['--organization', self.organization])
+        # Subcommands only, the options may hold credentials
+        name = " ".join(['hammer'] + list(itertools.takewhile(lambda a: not a.startswith('-'), args)))
+        if threaded:
+            # module.run_command swaps os.environ around, it isn't thread safe
+            rc, out, err = self.timings.call(command, name=name)
+        else:
+            rc, out, err = self._cmd(command, name=name)
+        if rc != 0:
+            raise HammerError("Command (%s) failed: %s" % (" ".join(args), err or out))
+        return out
 
-	def update(content_view, components):
-		args = 'content-view update --name %s --component-ids %s' % (content_view, ",".join(components))
-		rc, out, err = self._hammer(args)
-		return out
+    def _parse(self, out):
+        return yaml.safe_load(out) or {}
 
-	def promote(id, lifecycle_environment):
-		args = 'content-view version promote --id %s --to-lifecycle-environment "%s"' % (id, lifecycle_environment)
-		rc, out, err = self._hammer(args)
-		return out
+    def _query(self, args):
+        # Read-only queries are answered at most once per run
+        key = tuple(args)
+        if key not in self._cache:
+            self._cache[key] = self._parse(self._hammer(args))
+        return self._cache[key]
 
+    def _invalidate(self, content_view):
+        for key in list(self._cache.keys()):
+            if content_view in key:
+                del self._cache[key]
+
+    def login(self):
+        # Authenticate once instead of on every single hammer command
+        fd, config = tempfile.mkstemp(prefix='hammer', suffix='.yml')
+        with os.fdopen(fd, 'w') as f:
+            f.write(":foreman:\n  :use_sessions: true\n")
+        command = [self.executable, '-c', config, 'auth', 'login', 'basic', '-u', self.username, '-p', self.password]
+        rc, out, err = self._cmd(command, name='hammer auth login')
+        if rc != 0:
+            os.remove(config)
+            return False
+        self.config = config
+        return True
+
+    def close(self):
+        # The session lives in ~/.hammer/sessions, usable by anything
+        # running as this user until it is logged out
+        if self.config:
+            self._cmd([self.executable, '-c', self.config, 'auth', 'logout'], name='hammer auth logout')
+            if os.path.isfile(self.config):
+                os.remove(self.config)
+        self.config = None
+
+    def upload_content(self, rpm_path, name, product):
+        # Runs in the upload pool
+        args = ['repository', 'upload-content', '--path', rpm_path, '--name', name, '--product', product]
+        return self._hammer(args, threaded=True)
+
+    def _task_id(self, out):
+        match = re.search(r'task\s+([0-9a-fA-F-]+)', out)
+        if not match:
+            raise HammerError("Unable to find the task id in the hammer output (%s)." % (out.strip()))
+        return match.group(1)
+
+    def publish(self, content_view, wait=True):
+        args = ['content-view', 'publish', '--name', content_view]
+        self._invalidate(content_view)
+        if wait:
+            return self._hammer(args)
+        return self._task_id(self._hammer(args + ['--async']))
+
+    def version_list(self, content_view):
+        args = ['content-view', 'version', 'list', '--content-view', content_view]
+        return self._query(args)
+
+    def latest_version(self, content_view):
+        versions = self.version_list(content_view)
+        if not versions:
+            raise HammerError("Content view (%s) has no published versions." % (content_view))
+        return max(versions, key=lambda v: int(v['ID']))
+
+    def info(self, content_view):
+        args = ['content-view', 'info', '--name', content_view]
+        return self._query(args)
+
+    def components(self, composite_view):
+        # Maps every component content view name to its current version id
+        components = {}
+        for component in self.info(composite_view).get('Components') or []:
+            # Versions are displayed as "<content view> <version>"
+            name = component['Name'].rsplit(' ', 1)[0]
+            components[name] = str(component['ID'])
+        return components
+
+    def update(self, content_view, components):
+        args = ['content-view', 'update', '--name', content_view, '--component-ids', ",".join(components)]
+        self._invalidate(content_view)
+        return self._hammer(args)
+
+    def promote(self, id, lifecycle_environment, wait=True):
+        args = ['content-view', 'version', 'promote', '--id', str(id), '--to-lifecycle-environment', lifecycle_environment]
+        if wait:
+            return self._hammer(args)
+        return self._task_id(self._hammer(args + ['--async']))
+
+    def task_info(self, id):
+        # Task state changes between calls, so this one is never cached
+        return self._parse(self._hammer(['task', 'info', '--id', id], organization=False))
+
+    def wait(self, chains, timeout):
+        # Submits the first call of every chain, and the next one of a chain
+        # once the previous task finished. Polls every pending task per
+        # round, backing off exponentially while nothing moves
+        durations = {}
+        pending = {}
+        delay = 1
+        deadline = time.time() + timeout
+
+        def submit(chain):
+            key, function, args = chain[0]
+            pending[key] = (function(*args, wait=False), time.time(), chain[1:])
+
+        for chain in chains:
+            if chain:
+                submit(chain)
+        while pending:
+            progressed = False
+            for key, (id, start, rest) in list(pending.items()):
+                info = self.task_info(id)
+                if info.get('State') not in ('stopped', 'paused'):
+                    continue
+                del pending[key]
+                if info.get('Result') != 'success':
+                    raise HammerError("Task (%s) finished with result (%s)." % (id, info.get('Result')))
+                durations[key] = task_duration(info, start)
+                if rest:
+                    submit(rest)
+                    progressed = True
+            if not pending:
+                break
+            if progressed:
+                delay = 1
+                continue
+            if time.time() + delay > deadline:
+                raise HammerError("Timed out waiting for task(s) (%s)." % (", ".join(i for i, _, _ in pending.values())))
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+        return durations
+
+
+def parse_task_time(value):
+    # "2017-05-02 10:00:00 UTC", or a datetime if yaml recognised it
+    if isinstance(value, datetime.datetime):
+        return value.replace(tzinfo=None)
+    value = str(value or '').replace(' UTC', '').rstrip('Z').split('.')[0]
+    for format in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y/%m/%d %H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(value, format)
+        except ValueError:
+            pass
+    return None
+
+def task_duration(info, submitted):
+    # The task's own timestamps, polling would add up to a backoff delay
+    started = parse_task_time(info.get('Started at'))
+    ended = parse_task_time(info.get('Ended at'))
+    if started and ended:
+        return round((ended - started).total_seconds(), 3)
+    return round(time.time() - submitted, 3)
+
+def timed(function, *args):
+    start = time.time()
+    function(*args)
+    return round(time.time() - start, 3)
+
+def run_step(cli, chains, async_tasks, timeout):
+    # Runs every (key, function, args) of a step. The calls of a chain run
+    # in order, different chains overlap when the tasks are asynchronous
+    if not async_tasks:
+        return dict((key, timed(function, *args)) for chain in chains for key, function, args in chain)
+    return cli.wait(chains, timeout)
+
+def expand_rpms(patterns):
+    rpms = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if path not in rpms:
+                rpms.append(path)
+    return rpms
+
+def unique(items):
+    seen = []
+    for item in items or []:
+        if item not in seen:
+            seen.append(item)
+    return seen
 
 def main():
     module = AnsibleModule(
         argument_spec=dict(
             username=dict(required=True),
-            password=dict(required=True),
-            rpm=dict(required=True, type='path'),
+            password=dict(required=True, no_log=True),
+            rpm=dict(required=True, type='list'),
             organization=dict(required=True),
-			product=dict(required=True),
-			name=dict(required=True),
-            content_view=dict(required=True),
-			composite_view=dict(required=False, type='bool', default=False),
-			lifecycle_environment=dict(required=False),
+            product=dict(required=True),
+            name=dict(required=True),
+            content_view=dict(required=True, type='list'),
+            composite_view=dict(required=False, type='list', default=[]),
+            lifecycle_environment=dict(required=False, type='list', default=[]),
+            concurrency=dict(required=False, type='int', default=4),
+            async_tasks=dict(required=False, type='bool', default=False),
+            task_timeout=dict(required=False, type='int', default=3600),
+            use_sessions=dict(required=False, type='bool', default=True),
+            executable=dict(default=None, type='path'),
         ),
         supports_check_mode=False
     )
@@ -108,31 +371,84 @@ def main():
     rpm = module.params['rpm']
     product = module.params['product']
     name = module.params['name']
-    content_view = module.params['content_view']
-    composite_view = module.params['composite_view']
-    lifecycle_environment = module.params['lifecycle_environment']
+    content_views = unique(module.params['content_view'])
+    composite_views = unique(module.params['composite_view'])
+    lifecycle_environments = unique(module.params['lifecycle_environment'])
+    concurrency = module.params['concurrency']
+    async_tasks = module.params['async_tasks']
+    task_timeout = module.params['task_timeout']
+    use_sessions = module.params['use_sessions']
+    executable = module.params['executable'] or module.get_bin_path('hammer', True)
+
+    if not HAS_YAML:
+        module.fail_json(msg="PyYAML is required to parse the hammer output.")
 
     # If the password is a file, read it
     if os.path.isfile(password):
         with open(password) as password_file:
             password = password_file.read().strip()
 
-    if not os.path.isfile(rpm):
-        module.fail_json(msg="rpm parameter (%s) must be a valid rpm file." % (rpm))
+    rpms = expand_rpms(rpm)
+    for path in rpms:
+        if not os.path.isfile(path):
+            module.fail_json(msg="rpm parameter (%s) must be a valid rpm file." % (path))
+    if concurrency < 1:
+        module.fail_json(msg="The concurrency parameter must be greater than 0.")
+
+    cli = Hammer(module, username, password, organization, executable)
+    uploaded = []
+    published = {}
+    promoted = {}
+
+    try:
+        if use_sessions:
+            cli.login()
+
+        # Every upload must be done before anything gets published
+        pool = ThreadPool(min(concurrency, len(rpms) or 1))
+        try:
+            durations = pool.map(lambda path: timed(cli.upload_content, path, name, product), rpms)
+        finally:
+            pool.close()
+            pool.join()
+        for path, duration in zip(rpms, durations):
+            uploaded.append(dict(rpm=path, duration=duration))
+
+        durations = run_step(cli, [[(cv, cli.publish, (cv,))] for cv in content_views], async_tasks, task_timeout)
+        for cv in content_views:
+            published[cv] = dict(version_id=str(cli.latest_version(cv)['ID']), duration=durations[cv])
+
+        for composite in composite_views:
+            components = cli.components(composite)
+            current = sorted(components.values())
+            for cv in content_views:
+                if cv in components:
+                    components[cv] = published[cv]['version_id']
+            if sorted(components.values()) != current:
+                cli.update(composite, sorted(components.values()))
+        durations = run_step(cli, [[(c, cli.publish, (c,))] for c in composite_views], async_tasks, task_timeout)
+        for composite in composite_views:
+            published[composite] = dict(version_id=str(cli.latest_version(composite)['ID']), duration=durations[composite])
 
-    cli = Hammer(module, username, password, organization)
-    cli.upload_content(rpm, name, product)
-    cli.publish(content_view)
+        # One chain per view, its environments in the given lifecycle order
+        chains = []
+        for view in composite_views or content_views:
+            promoted[view] = {}
+            chains.append([((view, env), cli.promote, (published[view]['version_id'], env)) for env in lifecycle_environments])
+        durations = run_step(cli, chains, async_tasks, task_timeout)
+        for (view, env), duration in durations.items():
+            promoted[view][env] = dict(version_id=published[view]['version_id'], duration=duration)
+    except HammerError as e:
+        module.fail_json(msg=str(e), uploaded=uploaded, published=published, promoted=promoted,
+                         timings=cli.timings.summary())
+    finally:
+        # Whichever way the module leaves, the session mustn't outlive it
+        cli.close()
 
-    if composite_view:
-        latest_id = cli.version_list(content_view)[-1]
-        content_view_list = cli.info(composite_view)
-        for cv in content_view_list:
-            cli.update(cv, latest_id)
-            cli.publish(composite_view)
-        cli.promote(latest_id, lifecycle_environment)
+    module.exit_json(changed=True, rpm=rpms, content_view=content_views, composite_view=composite_views,
+                     uploaded=uploaded, published=published, promoted=promoted, timings=cli.timings.summary())
 
-    module.exit_json(changed=True, rpm_path=rpm_path, content_view=content_view)
- 
 from ansible.module_utils.basic import *
-main()
+from ansible.module_utils.timings import Timings
+if __name__ == '__main__':
+    main()
@@ -101,6 +101,16 @@ options:
         default: 'no'
         choices: ['yes', 'no']
         version_added: "2.1.0"
+    retries:
+        description:
+            - How many times a request is retried, with exponential backoff, after a network error or a 5xx answer.
+        required: false
+        default: 2
+    timeout:
+        description:
+            - Timeout in seconds of the connection and of every read from it.
+        required: false
+        default: 10
 '''
 
 EXAMPLES = '''
@@ -115,7 +125,7 @@ EXAMPLES = '''
 '''
 
 from ansible.module_utils.basic import *
-from ansible.module_utils.urls import *
+from ansible.module_utils.timings import Timings
 
 import lxml.etree as etree
 import os
@@ -123,6 +133,8 @@ import hashlib
 import sys
 import posixpath
 
+CHUNK_SIZE = 64 * 1024
+
 
 class Artifact(object):
     def __init__(self, group_id, artifact_id, version, classifier=None, extension='jar'):
@@ -148,13 +160,18 @@ class MavenClient:
     def __init__(self, module, repository):
         self.module = module
         self.repo = repository.rstrip("/")
+        # Every request goes to the same repository, so it reuses one connection
+        self.timings = Timings(retries=module.params['retries'], timeout=module.params['timeout'])
+        self.http = dict(
+            username=module.params['url_username'],
+            password=module.params['url_password'],
+            validate_certs=module.params['validate_certs'],
+            headers={'User-Agent': module.params['http_agent']},
+        )
 
     def get(self, url):
         url = posixpath.join(self.repo, url)
-        response, info = fetch_url(self.module, url)
-        if info['status'] != 200:
-            raise Exception("Unable to complete request (%s)" % (url))
-        return response.read()
+        return self.timings.fetch(url, **self.http)
 
     def download_metadata(self, artifact):
         url = "%s/maven-metadata.xml" % (posixpath.join(*artifact.url.split("/")[0:-2]))
@@ -166,25 +183,28 @@ class MavenClient:
         return self.download_metadata(artifact).xpath("/metadata/versioning/versions/version/text()")
 
     def get_md5(self, artifact):
-        return self.get(artifact.url + '.md5')
+        # Some repositories append the file name after the digest
+        return self.get(artifact.url + '.md5').decode('ascii').split()[0].strip().lower()
 
     def download(self, artifact, destination):
         if os.path.isdir(destination) or destination.endswith("/"):
             destination = os.path.join(destination, artifact.filename)
-        with open(destination, 'w') as file:
-            response = self.get(artifact.url)
-            file.write(response)
+        url = posixpath.join(self.repo, artifact.url)
+        with open(destination, 'wb') as file:
+            # Streamed, large artifacts never have to fit in memory
+            self.timings.download(url, file, **self.http)
         return destination
 
     def checksum(self, artifact, dest):
         if not os.path.isfile(dest):
             return False
         remote_md5 = self.get_md5(artifact)
-        local_md5 = None
+        local_md5 = hashlib.md5()
         with open(dest, 'rb') as file:
-            local_md5 = hashlib.md5(file.read()).hexdigest()
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                local_md5.update(chunk)
 
-        return remote_md5 == local_md5
+        return remote_md5 == local_md5.hexdigest()
 
 
 def main():
@@ -204,6 +224,8 @@ def main():
             dest = dict(type='path', default=None),
             validate_certs = dict(default=True, type='bool'),
             ignore_checksum = dict(default=False, type='bool'),
+            retries = dict(default=2, type='int'),
+            timeout = dict(default=10, type='int'),
         )
     )
     group_id = module.params["group_id"]
@@ -222,8 +244,8 @@ def main():
     if version == 'latest':
         try:
             artifact.version = client.get_versions(artifact)[-1]
-        except Exception, e:
-            module.fail_json(msg=e.args[0])
+        except Exception as e:
+            module.fail_json(msg=e.args[0], timings=client.timings.summary())
 
     if os.path.isdir(dest):
         dest = os.path.join(dest, artifact.filename)
@@ -232,23 +254,23 @@ def main():
     if state == 'absent':
         if os.path.isfile(dest):
             os.remove(dest)
-            module.exit_json(dest=dest, state=state, changed=True)
+            module.exit_json(dest=dest, state=state, changed=True, timings=client.timings.summary())
         else:
-            module.exit_json(dest=dest, state=state, changed=False)
+            module.exit_json(dest=dest, state=state, changed=False, timings=client.timings.summary())
 
     # Does the local file already exist and match the remote md5?
     if client.checksum(artifact, dest):
-        module.exit_json(dest=dest, state=state, version=artifact.version, changed=False)
+        module.exit_json(dest=dest, state=state, version=artifact.version, changed=False, timings=client.timings.summary())
 
     try:
         client.download(artifact, dest)
-    except Exception, e:
-        module.fail_json(msg=e.args[0])
+    except Exception as e:
+        module.fail_json(msg=e.args[0], timings=client.timings.summary())
 
-    if ignore_checksum and not client.checksum(artifact, dest):
-        module.fail_json(msg="I was able to download the artifact (%s), but the checksum doesn't match (%s)." % (artifact.url, dest))
+    if not ignore_checksum and not client.checksum(artifact, dest):
+        module.fail_json(msg="I was able to download the artifact (%s), but the checksum doesn't match (%s)." % (artifact.url, dest), timings=client.timings.summary())
 
-    module.exit_json(state=state, dest=dest, group_id=group_id, artifact_id=artifact_id, version=artifact.version, classifier=classifier, extension=extension, url_repository=repo, ignore_checksum=ignore_checksum, changed=True)
+    module.exit_json(state=state, dest=dest, group_id=group_id, artifact_id=artifact_id, version=artifact.version, classifier=classifier, extension=extension, url_repository=repo, ignore_checksum=ignore_checksum, changed=True, timings=client.timings.summary())
 
 
 if __name__ == '__main__':
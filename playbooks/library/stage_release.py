@@ -0,0 +1,248 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+
+DOCUMENTATION = '''
+---
+module: stage_release
+short_description: Installs a release tarball into a versioned directory.
+description:
+   - Downloads a release tarball once into a local cache indexed by its
+     checksum, verifies it against the published checksum file and extracts
+     it into C(dest)/C(name). The extraction happens in a temporary
+     directory which is renamed into place, so C(dest)/C(name) is either
+     complete or absent.
+   - If C(dest)/C(name) was already staged from the same url, nothing is
+     downloaded nor extracted.
+   - An existing C(dest)/C(name) is never replaced nor removed. Without a
+     manifest (e.g. extracted by unarchive) it is adopted as is, only its
+     manifest is written. A manifest for another url is only updated if
+     both urls publish the same checksum, otherwise the module fails.
+version_added: "1.0"
+options:
+  url:
+    description:
+      - Url of the .tar.gz release.
+    required: true
+  checksum_url:
+    description:
+      - Url of the published checksum file. The algorithm is taken from its
+        extension (sha1, sha256 or sha512).
+    required: false
+    default: "I(url).sha512"
+  dest:
+    description:
+      - Directory where the release directory is created.
+    required: false
+    default: /opt
+  name:
+    description:
+      - Name of the release directory, the top level directory of the
+        tarball is renamed to it.
+    required: false
+    default: basename of I(url) without the .tar.gz extension
+  cache_dir:
+    description:
+      - Where the verified tarballs are kept between runs.
+    required: false
+    default: /var/cache/ansible/releases
+  timeout:
+    description:
+      - Timeout in seconds of the connection and of every read from it.
+    required: false
+    default: 10
+'''
+
+EXAMPLES = '''
+# Install elasticsearch 5.5.0 into /opt/elasticsearch-5.5.0
+- stage_release: url=https://artifacts.elastic.co/downloads/elasticsearch/elasticsearch-5.5.0.tar.gz
+# Verify against a sha1 checksum instead
+- stage_release: url=https://artifacts.elastic.co/downloads/kibana/kibana-5.2.2-linux-x86_64.tar.gz checksum_url=https://artifacts.elastic.co/downloads/kibana/kibana-5.2.2-linux-x86_64.tar.gz.sha1
+'''
+
+from ansible.module_utils.basic import *
+from ansible.module_utils.timings import Timings
+
+import os
+import json
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import posixpath
+
+MANIFEST = '.stage_release.json'
+
+
+def read_manifest(path):
+    manifest = os.path.join(path, MANIFEST)
+    if not os.path.isfile(manifest):
+        return None
+    try:
+        with open(manifest) as f:
+            return json.load(f)
+    except ValueError:
+        return None
+
+def write_manifest(path, data):
+    with open(os.path.join(path, MANIFEST), 'w') as f:
+        json.dump(data, f)
+
+def expected_checksum(timings, checksum_url, validate_certs):
+    # Checksum files are "<digest>  <filename>" or just "<digest>"
+    content = timings.fetch(checksum_url, name='checksum', validate_certs=validate_certs)
+    return content.decode('utf-8').split()[0].strip().lower()
+
+def download(timings, url, algorithm, cache_dir, validate_certs):
+    # Hash while streaming so the tarball is only read once
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, prefix='.download')
+    digest = hashlib.new(algorithm)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            size = timings.download(url, f, name='download', digests=[digest], validate_certs=validate_certs)
+    except Exception:
+        os.remove(tmp)
+        raise
+    return tmp, digest.hexdigest(), size
+
+def safe_members(tar, root):
+    root = os.path.realpath(root)
+    for member in tar:
+        path = os.path.realpath(os.path.join(root, member.name))
+        if path != root and not path.startswith(root + os.sep):
+            raise Exception("Refusing to extract (%s) outside of (%s)." % (member.name, root))
+        if member.issym() or member.islnk():
+            # tarfile resolves hard links against the extraction root and
+            # symbolic links against the directory holding them
+            if member.islnk():
+                target = os.path.realpath(os.path.join(root, member.linkname))
+            else:
+                target = os.path.realpath(os.path.join(os.path.dirname(path), member.linkname))
+            if not target.startswith(root + os.sep):
+                raise Exception("Refusing to extract link (%s) pointing outside of (%s)." % (member.name, root))
+        yield member
+
+def extract(archive, dest, name):
+    tmp = tempfile.mkdtemp(dir=dest, prefix='.%s.' % (name))
+    try:
+        # Streaming mode decompresses sequentially without seeking back
+        tar = tarfile.open(archive, 'r|gz')
+        try:
+            if hasattr(tarfile, 'data_filter'):
+                # Python >= 3.12 (and the security backports) check on their own too
+                tar.extractall(tmp, members=safe_members(tar, tmp), filter='data')
+            else:
+                tar.extractall(tmp, members=safe_members(tar, tmp))
+        finally:
+            tar.close()
+        entries = os.listdir(tmp)
+        if len(entries) == 1 and os.path.isdir(os.path.join(tmp, entries[0])):
+            source = os.path.join(tmp, entries[0])
+        else:
+            source = tmp
+        os.chmod(source, 0o755)
+
+        # Never replaces an existing directory, main() adopts those instead
+        target = os.path.join(dest, name)
+        if os.path.lexists(target):
+            raise Exception("Path (%s) appeared while the release was being extracted." % (target))
+        os.rename(source, target)
+    finally:
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp)
+    return target
+
+
+def main():
+
+    module = AnsibleModule(
+        argument_spec = dict(
+            url = dict(required=True),
+            checksum_url = dict(required=False, default=None),
+            dest = dict(type='path', required=False, default='/opt'),
+            name = dict(required=False, default=None),
+            cache_dir = dict(type='path', required=False, default='/var/cache/ansible/releases'),
+            validate_certs = dict(default=True, type='bool'),
+            timeout = dict(type='int', required=False, default=10),
+        ),
+        supports_check_mode=True
+    )
+
+    url = module.params["url"]
+    checksum_url = module.params["checksum_url"] or url + '.sha512'
+    dest = module.params["dest"]
+    name = module.params["name"] or posixpath.basename(url).replace('.tar.gz', '').replace('.tgz', '')
+    cache_dir = module.params["cache_dir"]
+    validate_certs = module.params["validate_certs"]
+    timeout = module.params["timeout"]
+
+    algorithm = posixpath.splitext(checksum_url)[1].lstrip('.').lower()
+    target = os.path.join(dest, name)
+
+    # Sanity check
+    if algorithm not in ('sha1', 'sha256', 'sha512'):
+        module.fail_json(msg="Unable to guess the checksum algorithm from the checksum_url (%s)." % (checksum_url))
+    if not os.path.isdir(dest):
+        module.fail_json(msg="Dest parameter (%s) must be a valid directory." % (dest))
+
+    manifest = read_manifest(target)
+    if manifest and manifest.get('url') == url:
+        module.exit_json(changed=False, path=target, url=url, checksum=manifest.get('checksum'))
+    if os.path.lexists(target) and (os.path.islink(target) or not os.path.isdir(target)):
+        module.fail_json(msg="Path (%s) already exists and isn't a directory." % (target))
+    if module.check_mode:
+        module.exit_json(changed=True, path=target, url=url)
+
+    timings = Timings(retries=2, timeout=timeout)
+    try:
+        checksum = expected_checksum(timings, checksum_url, validate_certs)
+
+        if os.path.isdir(target):
+            # Installed before stage_release was used, or staged from another url
+            if manifest and manifest.get('checksum') != checksum:
+                module.fail_json(msg="Path (%s) holds another release (%s), it must be removed first." % (target, manifest.get('url')),
+                                 path=target, url=url, timings=timings.summary())
+            write_manifest(target, dict(url=url, checksum=checksum, algorithm=algorithm, adopted=manifest is None))
+            timings.close()
+            module.exit_json(changed=True, path=target, url=url, checksum=checksum, adopted=True, timings=timings.summary())
+
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        archive = os.path.join(cache_dir, '%s-%s.tar.gz' % (algorithm, checksum))
+        cached = os.path.isfile(archive)
+        size = 0
+        if not cached:
+            tmp, actual, size = download(timings, url, algorithm, cache_dir, validate_certs)
+            if actual != checksum:
+                os.remove(tmp)
+                module.fail_json(msg="Checksum of (%s) doesn't match (%s): expected (%s), got (%s)." % (url, checksum_url, checksum, actual),
+                                 timings=timings.summary())
+            # Only verified tarballs ever get their content address
+            os.rename(tmp, archive)
+
+        with timings.step('extract'):
+            extract(archive, dest, name)
+            write_manifest(target, dict(url=url, checksum=checksum, algorithm=algorithm))
+    except Exception as e:
+        module.fail_json(msg=str(e), path=target, url=url, timings=timings.summary())
+    timings.close()
+
+    module.exit_json(changed=True, path=target, url=url, checksum=checksum, archive=archive, cached=cached, adopted=False, bytes=size, timings=timings.summary())
+
+
+if __name__ == '__main__':
+    main()
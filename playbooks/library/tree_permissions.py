@@ -0,0 +1,228 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+
+DOCUMENTATION = '''
+---
+module: tree_permissions
+short_description: Recursively enforces ownership and modes on a directory tree.
+description:
+   - Walks C(path) and only changes the entries whose owner, group or mode
+     differ from the requested ones. The changes are spread over a pool of
+     threads.
+   - Directories get C(dir_mode). Files get C(file_mode) or, if it isn't
+     given, 0755 when they are executable by anyone and 0644 otherwise.
+     Symbolic links only get their ownership changed.
+version_added: "1.0"
+requirements:
+   - "python >= 3.5 or the scandir package"
+options:
+  path:
+    description:
+      - Root of the tree.
+    required: true
+  owner:
+    description:
+      - Name or uid of the owner.
+    required: false
+    default: null
+  group:
+    description:
+      - Name or gid of the group.
+    required: false
+    default: null
+  dir_mode:
+    description:
+      - Octal mode of the directories.
+    required: false
+    default: "0755"
+  file_mode:
+    description:
+      - Octal mode of the regular files.
+    required: false
+    default: null
+  stamp:
+    description:
+      - File recording the settings of the last successful run. If it
+        matches the current settings the tree isn't walked at all, so it
+        should live somewhere that is recreated whenever the tree is.
+    required: false
+    default: null
+  threads:
+    description:
+      - Number of threads issuing the chown/chmod calls.
+    required: false
+    default: 8
+'''
+
+EXAMPLES = '''
+# Give an install tree to its service user
+- tree_permissions: path=/opt/elasticsearch-5.5.0 owner=elastic group=elastic stamp=/opt/elasticsearch-5.5.0/.tree_permissions
+'''
+
+import os
+import grp
+import pwd
+import json
+import stat
+from multiprocessing.pool import ThreadPool
+
+try:
+    from os import scandir
+    HAS_SCANDIR = True
+except ImportError:
+    try:
+        from scandir import scandir
+        HAS_SCANDIR = True
+    except ImportError:
+        HAS_SCANDIR = False
+
+
+def resolve(name, database):
+    if name is None:
+        return -1
+    if str(name).isdigit():
+        return int(name)
+    return database(name)[2]
+
+def wanted_mode(st, dir_mode, file_mode):
+    if stat.S_ISDIR(st.st_mode):
+        return dir_mode
+    if file_mode is not None:
+        return file_mode
+    if st.st_mode & 0o111:
+        return 0o755
+    return 0o644
+
+def inspect(path, st, uid, gid, dir_mode, file_mode):
+    # Returns the (path, uid, gid, mode) fix for an entry, None if it's fine
+    fix_uid = uid if uid != -1 and st.st_uid != uid else -1
+    fix_gid = gid if gid != -1 and st.st_gid != gid else -1
+    mode = None
+    if not stat.S_ISLNK(st.st_mode):
+        mode = wanted_mode(st, dir_mode, file_mode)
+        if stat.S_IMODE(st.st_mode) == mode:
+            mode = None
+    if fix_uid == -1 and fix_gid == -1 and mode is None:
+        return None
+    return (path, fix_uid, fix_gid, mode)
+
+def walk(root, uid, gid, dir_mode, file_mode, exclude):
+    fixes = []
+    scanned = 1
+    fix = inspect(root, os.lstat(root), uid, gid, dir_mode, file_mode)
+    if fix:
+        fixes.append(fix)
+
+    stack = [root]
+    while stack:
+        for entry in scandir(stack.pop()):
+            if entry.path == exclude:
+                continue
+            scanned += 1
+            st = entry.stat(follow_symlinks=False)
+            fix = inspect(entry.path, st, uid, gid, dir_mode, file_mode)
+            if fix:
+                fixes.append(fix)
+            if stat.S_ISDIR(st.st_mode):
+                stack.append(entry.path)
+    return fixes, scanned
+
+def apply(fix):
+    path, uid, gid, mode = fix
+    if uid != -1 or gid != -1:
+        os.lchown(path, uid, gid)
+    if mode is not None:
+        os.chmod(path, mode)
+
+def read_stamp(path):
+    if not path or not os.path.isfile(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except ValueError:
+        return None
+
+
+def main():
+
+    module = AnsibleModule(
+        argument_spec = dict(
+            path = dict(type='path', required=True),
+            owner = dict(required=False, default=None),
+            group = dict(required=False, default=None),
+            dir_mode = dict(required=False, default='0755'),
+            file_mode = dict(required=False, default=None),
+            stamp = dict(type='path', required=False, default=None),
+            threads = dict(type='int', required=False, default=8),
+        ),
+        supports_check_mode=True
+    )
+
+    path = module.params["path"]
+    owner = module.params["owner"]
+    group = module.params["group"]
+    stamp = module.params["stamp"]
+    threads = module.params["threads"]
+
+    # Sanity check
+    if not HAS_SCANDIR:
+        module.fail_json(msg="The scandir package is required on python < 3.5.")
+    if not os.path.isdir(path):
+        module.fail_json(msg="Path parameter (%s) must be a valid directory." % (path))
+    if threads < 1:
+        module.fail_json(msg="The threads parameter must be greater than 0.")
+    try:
+        dir_mode = int(str(module.params["dir_mode"]), 8)
+        file_mode = module.params["file_mode"]
+        if file_mode is not None:
+            file_mode = int(str(file_mode), 8)
+    except ValueError:
+        module.fail_json(msg="The dir_mode and file_mode parameters must be octal numbers.")
+    try:
+        uid = resolve(owner, pwd.getpwnam)
+        gid = resolve(group, grp.getgrnam)
+    except KeyError as e:
+        module.fail_json(msg="Unknown owner or group: %s" % (e))
+
+    settings = dict(path=path, uid=uid, gid=gid, dir_mode=dir_mode, file_mode=file_mode)
+    if read_stamp(stamp) == settings:
+        module.exit_json(changed=False, path=path, fixed=0, scanned=0, skipped=True)
+
+    fixes, scanned = walk(path, uid, gid, dir_mode, file_mode, stamp)
+
+    if fixes and not module.check_mode:
+        pool = ThreadPool(min(threads, len(fixes)))
+        try:
+            pool.map(apply, fixes, chunksize=256)
+        except OSError as e:
+            module.fail_json(msg="Unable to fix the permissions of (%s): %s" % (e.filename, e.strerror))
+        finally:
+            pool.close()
+            pool.join()
+
+    if stamp and not module.check_mode:
+        with open(stamp, 'w') as f:
+            json.dump(settings, f)
+
+    module.exit_json(changed=bool(fixes), path=path, fixed=len(fixes), scanned=scanned, skipped=False)
+
+# import module snippets
+from ansible.module_utils.basic import *
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+
+# Instrumented subprocess and HTTP calls for the library modules.
+#
+# Every call made through a Timings object is recorded with its duration,
+# the bytes it moved and the attempts it took. The modules return
+# Timings.summary() as their "timings" result, which is what the
+# benchmark_ing callback aggregates.
+
+import os
+import time
+import base64
+import threading
+import subprocess
+
+try:
+    import http.client as httplib
+    from urllib.parse import urlsplit, urljoin, unquote
+    from urllib.request import getproxies, proxy_bypass
+except ImportError:
+    import httplib
+    from urlparse import urlsplit, urljoin
+    from urllib import getproxies, proxy_bypass, unquote
+
+try:
+    import ssl
+    HAS_SSL = True
+except ImportError:
+    HAS_SSL = False
+
+CHUNK_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+# Same default as fetch_url
+TIMEOUT = 10
+
+
+def basic_auth(username, password):
+    token = base64.b64encode(('%s:%s' % (username, password or '')).encode('utf-8'))
+    return 'Basic %s' % (token.decode('ascii'))
+
+
+class HTTPError(Exception):
+
+    def __init__(self, url, status, reason):
+        Exception.__init__(self, "Unable to complete request (%s): %s %s" % (url, status, reason))
+        self.url = url
+        self.status = status
+
+
+class Timings(object):
+
+    def __init__(self, retries=0, delay=1, timeout=TIMEOUT):
+        self.retries = retries
+        self.delay = delay
+        self.timeout = timeout
+        self.calls = []
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def _record(self, kind, name, start, size, attempts, **extra):
+        call = dict(kind=kind, name=name, duration=round(time.time() - start, 3), bytes=size, attempts=attempts)
+        call.update(extra)
+        with self._lock:
+            self.calls.append(call)
+        return call
+
+    def _backoff(self, attempt):
+        time.sleep(self.delay * (2 ** attempt))
+
+    def step(self, name):
+        """
+        Context manager timing a block which isn't an external call
+        """
+        return _Step(self, name)
+
+    def run(self, module, command, name=None, check_rc=False, retry_rc=None, **kwargs):
+        """
+        module.run_command, retrying while rc is in retry_rc
+        """
+        name = name or os.path.basename(command[0] if isinstance(command, list) else command.split()[0])
+        start = time.time()
+        attempt = 0
+        while True:
+            rc, out, err = module.run_command(command, check_rc, **kwargs)
+            if not retry_rc or rc not in retry_rc or attempt >= self.retries:
+                break
+            self._backoff(attempt)
+            attempt += 1
+        self._record('command', name, start, len(out or '') + len(err or ''), attempt + 1, rc=rc)
+        return (rc, out, err)
+
+    def call(self, command, name=None, cwd=None, retry_rc=None):
+        """
+        Same as run, for code which has no module at hand (threads)
+        """
+        name = name or os.path.basename(command[0])
+        start = time.time()
+        attempt = 0
+        while True:
+            proc = subprocess.Popen(command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    universal_newlines=True)
+            out, err = proc.communicate()
+            rc = proc.returncode
+            if not retry_rc or rc not in retry_rc or attempt >= self.retries:
+                break
+            self._backoff(attempt)
+            attempt += 1
+        self._record('command', name, start, len(out) + len(err), attempt + 1, rc=rc)
+        return (rc, out, err)
+
+    def _connection(self, scheme, netloc, validate_certs):
+        # One kept-alive connection per (thread, host)
+        key = (threading.current_thread().ident, scheme, netloc)
+        if key not in self._connections:
+            # *_proxy and no_proxy are honoured the way urllib does
+            proxy = None
+            if not proxy_bypass(netloc):
+                proxy = getproxies().get(scheme)
+            proxy_headers = {}
+            target = netloc
+            if proxy:
+                proxy = urlsplit(proxy if '://' in proxy else 'http://' + proxy)
+                # Credentials go in a header, never in the host to connect to
+                target = proxy.netloc.rsplit('@', 1)[-1]
+                if proxy.username:
+                    proxy_headers['Proxy-Authorization'] = basic_auth(unquote(proxy.username), unquote(proxy.password or ''))
+            if scheme == 'https':
+                context = None
+                if HAS_SSL and not validate_certs:
+                    context = ssl._create_unverified_context()
+                conn = httplib.HTTPSConnection(target, timeout=self.timeout, context=context)
+                if proxy:
+                    conn.set_tunnel(netloc, headers=proxy_headers)
+                proxy_headers = {}
+            else:
+                conn = httplib.HTTPConnection(target, timeout=self.timeout)
+            # Plain http proxies expect the absolute url in the request line
+            # and their credentials on every request
+            self._connections[key] = (conn, bool(proxy) and scheme == 'http', proxy_headers)
+        conn, absolute, proxy_headers = self._connections[key]
+        return key, conn, absolute, proxy_headers
+
+    def _request(self, url, username=None, password=None, validate_certs=True, headers=None):
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        headers = dict(headers or {})
+        if username:
+            headers['Authorization'] = basic_auth(username, password)
+
+        attempt = 0
+        while True:
+            key, conn, absolute, proxy_headers = self._connection(parts.scheme, parts.netloc, validate_certs)
+            if proxy_headers:
+                headers.update(proxy_headers)
+            try:
+                conn.request('GET', url if absolute else path, headers=headers)
+                response = conn.getresponse()
+                if response.status < 500 or attempt >= self.retries:
+                    return response, attempt + 1
+                response.read()
+            except (httplib.HTTPException, IOError, OSError):
+                # Stale kept-alive connection or network error, start afresh
+                conn.close()
+                del self._connections[key]
+                if attempt >= self.retries:
+                    raise
+            self._backoff(attempt)
+            attempt += 1
+
+    def _get(self, url, **kwargs):
+        origin = urlsplit(url)[:2]
+        attempts = 0
+        for _ in range(MAX_REDIRECTS + 1):
+            response, tries = self._request(url, **kwargs)
+            attempts += tries
+            location = response.getheader('location')
+            if response.status not in (301, 302, 303, 307, 308) or not location:
+                break
+            response.read()
+            url = location if '://' in location else urljoin(url, location)
+            if urlsplit(url)[:2] != origin:
+                # Like fetch_url, the credentials are scoped to the original
+                # host: CDNs mustn't get them and presigned urls reject them
+                kwargs = dict(kwargs, username=None, password=None)
+                kwargs['headers'] = dict((k, v) for k, v in (kwargs.get('headers') or {}).items()
+                                         if k.lower() != 'authorization')
+        return response, attempts
+
+    def fetch(self, url, name=None, **kwargs):
+        """
+        GET url and return its body
+        """
+        start = time.time()
+        response, attempts = self._get(url, **kwargs)
+        body = response.read()
+        self._record('http', name or url, start, len(body), attempts, status=response.status)
+        if response.status != 200:
+            raise HTTPError(url, response.status, response.reason)
+        return body
+
+    def download(self, url, dest, name=None, digests=(), **kwargs):
+        """
+        Stream url into the dest file object, updating digests on the way
+        """
+        start = time.time()
+        response, attempts = self._get(url, **kwargs)
+        size = 0
+        if response.status == 200:
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                for digest in digests:
+                    digest.update(chunk)
+                dest.write(chunk)
+                size += len(chunk)
+        else:
+            response.read()
+        self._record('http', name or url, start, size, attempts, status=response.status)
+        if response.status != 200:
+            raise HTTPError(url, response.status, response.reason)
+        return size
+
+    def close(self):
+        for conn, _, _ in self._connections.values():
+            conn.close()
+        self._connections = {}
+
+    def summary(self):
+        return dict(
+            calls=self.calls,
+            count=len(self.calls),
+            duration=round(sum(c['duration'] for c in self.calls), 3),
+            bytes=sum(c['bytes'] for c in self.calls),
+        )
+
+
+class _Step(object):
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings._record('step', self.name, self.start, 0, 1)
+        return False
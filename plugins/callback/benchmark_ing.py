@@ -33,16 +33,35 @@ class CallbackModule(ansible.plugins.callback.CallbackBase):
         self._running_tasks = collections.OrderedDict()
         self._playbook_start = time.time()
 
-    def _tracktask(self, key, task):
+    def _tracktask(self, key, task, result=None):
         uuid = str(task._uuid)
         if uuid not in self._running_tasks.keys():
             self._running_tasks[uuid] = {}
             self._running_tasks[uuid]['name'] = str(task).split(": ", 1)[1]
+            self._running_tasks[uuid]['calls'] = collections.OrderedDict()
         self._running_tasks[uuid][key] = time.time()
+        if result is not None:
+            self._trackcalls(uuid, result)
         if key == "stop" and self._display.verbosity > 0:
             delta = self._running_tasks[uuid]['stop'] - self._running_tasks[uuid]['start']
             self._display.display("Finished in (%.3f) seconds" % (delta), color='cyan')
 
+    def _trackcalls(self, uuid, result):
+        # Modules using module_utils.timings report their external calls
+        for item in result.get('results') or []:
+            if isinstance(item, dict):
+                self._trackcalls(uuid, item)
+        timings = result.get('timings')
+        if not isinstance(timings, dict):
+            return
+        calls = self._running_tasks[uuid]['calls']
+        for call in timings.get('calls', []):
+            name = "%s %s" % (call.get('kind'), call.get('name'))
+            total = calls.setdefault(name, {'count': 0, 'duration': 0.0, 'bytes': 0})
+            total['count'] += 1
+            total['duration'] += call.get('duration', 0)
+            total['bytes'] += call.get('bytes', 0)
+
     # Initialize the counter
     def v2_playbook_on_task_start(self, task, is_conditional):
         self._tracktask('start', task)
@@ -50,15 +69,15 @@ class CallbackModule(ansible.plugins.callback.CallbackBase):
         self._tracktask('start', task)
 
     def v2_runner_on_failed(self, result, ignore_errors=False):
-        self._tracktask('stop', result._task)
+        self._tracktask('stop', result._task, result._result)
     def v2_runner_on_ok(self, result):
-        self._tracktask('stop', result._task)
+        self._tracktask('stop', result._task, result._result)
     def v2_runner_on_unreachable(self, result):
         self._tracktask('stop', result._task)
     def v2_runner_on_async_ok(self, host, result):
         self._tracktask('stop', result._task)
     def v2_runner_on_async_failed(self, result):
-        self._tracktask('stop', result._task)
+        self._tracktask('stop', result._task, result._result)
 
     def v2_playbook_on_stats(self, stats):
         self._display.banner("BENCHMARK".upper())
@@ -73,3 +92,5 @@ class CallbackModule(ansible.plugins.callback.CallbackBase):
             elif delta > 300:
                 color = 'red'
             self._display.display("\tTask [%s]: %.3f seconds." % (v['name'], delta), color=color)
+            for name, call in v['calls'].items():
+                self._display.display("\t\t%s: %.3f seconds, %d call(s), %d bytes." % (name, call['duration'], call['count'], call['bytes']))
@@ -0,0 +1,74 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+# Past ~32GB the JVM can't use compressed object pointers anymore, stay
+# safely below it
+COMPRESSED_OOPS_MB = 31744
+MIN_HEAP_MB = 256
+ES_MAX_MAP_COUNT = 262144
+ES_NOFILE = 65536
+# The limit the role used before it was sized, never go below it
+ES_MIN_NPROC = 8096
+
+
+def jvm_heap_mb(memtotal_mb, ratio=0.5, maximum=COMPRESSED_OOPS_MB, minimum=MIN_HEAP_MB):
+    """
+    Heap for a JVM getting ratio of the host memory, the rest is left to
+    the OS page cache
+    """
+    heap = int(int(memtotal_mb) * ratio)
+    return max(minimum, min(heap, maximum))
+
+def elasticsearch_sizing(memtotal_mb, vcpus=1):
+    """
+    Heap, kernel and limits settings for an elasticsearch node
+    """
+    vcpus = max(1, int(vcpus))
+    return {
+        'heap_mb': jvm_heap_mb(memtotal_mb),
+        'max_map_count': ES_MAX_MAP_COUNT,
+        'nofile': ES_NOFILE,
+        'nproc': max(ES_MIN_NPROC, vcpus * 256),
+        'memlock': 'unlimited',
+    }
+
+def sonarqube_sizing(memtotal_mb):
+    """
+    Heaps of the three sonarqube processes, sharing half of the host memory:
+    the embedded elasticsearch gets half of it, web and compute engine a
+    quarter each
+    """
+    budget = jvm_heap_mb(memtotal_mb, maximum=3 * COMPRESSED_OOPS_MB)
+    return {
+        'search_heap_mb': jvm_heap_mb(budget, ratio=0.5),
+        'web_heap_mb': jvm_heap_mb(budget, ratio=0.25, maximum=4096, minimum=128),
+        'ce_heap_mb': jvm_heap_mb(budget, ratio=0.25, maximum=4096, minimum=128),
+        'max_map_count': ES_MAX_MAP_COUNT,
+    }
+
+
+class FilterModule(object):
+
+    """
+    Ansible filters sizing JVM heaps and OS limits from the host facts
+    """
+
+    def filters(self):
+        return {
+            'jvm_heap_mb': jvm_heap_mb,
+            'elasticsearch_sizing': elasticsearch_sizing,
+            'sonarqube_sizing': sonarqube_sizing,
+        }
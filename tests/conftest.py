@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import hashlib
+import tarfile
+import threading
+import subprocess
+import tracemalloc
+
+import pytest
+
+try:
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+except ImportError:
+    ThreadingHTTPServer = None
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_ansible
+
+fake_ansible.install()
+
+FAKES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fakes')
+# Large enough for a whole-body read to stand out from a streamed one
+LARGE_ARTIFACT_MB = int(os.environ.get('BENCH_ARTIFACT_MB', '32'))
+RELEASE_TREE_DIRS = int(os.environ.get('BENCH_TREE_DIRS', '10000'))
+
+_results = []
+
+
+def pytest_addoption(parser):
+    parser.addoption('--bench-json', default=None, help="Write the benchmark results to this json file.")
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    if not _results:
+        return
+    terminalreporter.section('benchmarks')
+    for r in _results:
+        counts = ", ".join("%s=%s" % (k, v) for k, v in sorted(r['counts'].items()))
+        alloc = '-' if r['peak_alloc_kb'] is None else '%.1fKiB' % (r['peak_alloc_kb'])
+        rss = '-' if r['peak_rss_kb'] is None else '%dKiB (+%d)' % (r['peak_rss_kb'], r['rss_growth_kb'])
+        terminalreporter.write_line("%-45s %8.3fs  alloc %12s  peak rss %18s  %s" % (
+            r['name'], r['wall'], alloc, rss, counts))
+    path = config.getoption('--bench-json')
+    if path:
+        with open(path, 'w') as f:
+            json.dump(_results, f, indent=2)
+
+
+class Counters(object):
+    """
+    Counts the subprocesses spawned and the filesystem calls made in-process
+    """
+
+    PATCHED = ('chmod', 'lchown', 'chown', 'rename')
+
+    def __init__(self, monkeypatch):
+        self.counts = dict(subprocess=0, **dict((name, 0) for name in self.PATCHED))
+        popen_init = subprocess.Popen.__init__
+
+        def counting_popen(popen, *args, **kwargs):
+            self.counts['subprocess'] += 1
+            popen_init(popen, *args, **kwargs)
+        monkeypatch.setattr(subprocess.Popen, '__init__', counting_popen)
+
+        for name in self.PATCHED:
+            monkeypatch.setattr(os, name, self._counting(name, getattr(os, name)))
+
+    def _counting(self, name, function):
+        def counted(*args, **kwargs):
+            self.counts[name] += 1
+            return function(*args, **kwargs)
+        return counted
+
+    def reset(self):
+        for key in self.counts:
+            self.counts[key] = 0
+
+    def __getitem__(self, key):
+        return self.counts[key]
+
+
+def reset_peak_rss():
+    # Linux >= 4.0 resets VmHWM to the current RSS, ru_maxrss can't be reset
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+def peak_rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    return None
+
+
+class Bench(object):
+    """
+    Measures wall time and peak RSS of a block, and its peak traced
+    allocations when asked to (tracing slows allocation heavy code down).
+    The peak RSS is the in-process one, the commands spawned aren't in it
+    """
+
+    def __init__(self, name, counters, servers, memory):
+        self.name = name
+        self.counters = counters
+        self.servers = servers
+        self.memory = memory
+        self.peak_alloc = None
+        self.peak_rss = None
+        self.rss_growth = None
+
+    def __enter__(self):
+        self.counters.reset()
+        for server in self.servers.values():
+            server.reset()
+        # Right after the reset, the peak is the RSS the block starts from
+        self.start_rss = peak_rss_kb() if reset_peak_rss() else None
+        if self.memory:
+            tracemalloc.start()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.time() - self.start
+        if self.memory:
+            self.peak_alloc = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if self.start_rss is not None:
+            self.peak_rss = peak_rss_kb()
+            self.rss_growth = max(0, self.peak_rss - self.start_rss)
+        counts = dict((k, v) for k, v in self.counters.counts.items() if v)
+        for key, server in self.servers.items():
+            counts[key] = server.count
+            counts[key + '_connections'] = server.connections
+        _results.append(dict(name=self.name, wall=round(self.wall, 3), peak_rss_kb=self.peak_rss,
+                             rss_growth_kb=self.rss_growth, counts=counts,
+                             peak_alloc_kb=None if self.peak_alloc is None else round(self.peak_alloc / 1024.0, 1)))
+        return False
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    return Counters(monkeypatch)
+
+@pytest.fixture
+def bench(counters):
+    """
+    bench(name, memory=False, **servers) -> context manager recording a
+    benchmark, servers are HTTPRepository objects whose request and
+    connection counts are recorded too
+    """
+    def factory(name, memory=False, **servers):
+        return Bench(name, counters, servers, memory)
+    return factory
+
+@pytest.fixture
+def run_module():
+    return fake_ansible.run_module
+
+
+class HTTPRepository(object):
+    """
+    Keep-alive capable static http server over a directory, counting the
+    requests and the connections it gets
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.count = 0
+        self.connections = 0
+        repository = self
+
+        class Handler(SimpleHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def __init__(self, *args, **kwargs):
+                kwargs['directory'] = repository.root
+                SimpleHTTPRequestHandler.__init__(self, *args, **kwargs)
+
+            def setup(self):
+                repository.connections += 1
+                SimpleHTTPRequestHandler.setup(self)
+
+            def send_head(self):
+                repository.count += 1
+                return SimpleHTTPRequestHandler.send_head(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:%d' % (self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def reset(self):
+        self.count = 0
+        self.connections = 0
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def write_artifact(path, size_mb):
+    # Pseudo random content, so it can't be compressed away
+    block = hashlib.sha512(b'bench').digest() * 1024
+    with open(path, 'wb') as f:
+        for i in range(size_mb * 16):
+            f.write(hashlib.sha512(str(i).encode('ascii')).digest() + block[64:])
+
+def make_release_tree(root, dirs, files_per_dir=1):
+    """
+    Synthetic release with dirs directories laid out two levels deep
+    """
+    width = int(dirs ** 0.5) or 1
+    created = 0
+    for i in range(width):
+        for j in range(width):
+            if created >= dirs:
+                return
+            path = os.path.join(root, 'lib%d' % (i), 'mod%d' % (j))
+            os.makedirs(path)
+            for k in range(files_per_dir):
+                with open(os.path.join(path, 'file%d' % (k)), 'w') as f:
+                    f.write('x')
+            created += 1
+
+def make_tarball(source, dest, flat=False):
+    # flat tarballs hold the content of source without a top level directory
+    with tarfile.open(dest, 'w:gz', compresslevel=1) as tar:
+        if flat:
+            for entry in sorted(os.listdir(source)):
+                tar.add(os.path.join(source, entry), arcname=entry)
+        else:
+            tar.add(source, arcname=os.path.basename(source))
+    with open(dest, 'rb') as f:
+        digest = hashlib.sha512()
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    with open(dest + '.sha512', 'w') as f:
+        f.write("%s  %s\n" % (digest.hexdigest(), os.path.basename(dest)))
+
+
+@pytest.fixture(scope='session')
+def maven_repository(tmp_path_factory):
+    """
+    Synthetic maven repository: com.example:small (two versions) and
+    com.example:large (a single LARGE_ARTIFACT_MB artifact)
+    """
+    if ThreadingHTTPServer is None:
+        pytest.skip("python 3.7 or later is needed for the http stand-in")
+    root = str(tmp_path_factory.mktemp('maven'))
+    for artifact, versions in (('small', ('1.0', '1.1')), ('large', ('2.0',))):
+        base = os.path.join(root, 'com', 'example', artifact)
+        for version in versions:
+            os.makedirs(os.path.join(base, version))
+            jar = os.path.join(base, version, '%s-%s.jar' % (artifact, version))
+            if artifact == 'large':
+                write_artifact(jar, LARGE_ARTIFACT_MB)
+            else:
+                with open(jar, 'wb') as f:
+                    f.write(b'small-' + version.encode('ascii'))
+            with open(jar, 'rb') as f:
+                digest = hashlib.md5()
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            with open(jar + '.md5', 'w') as f:
+                f.write(digest.hexdigest())
+        with open(os.path.join(base, 'maven-metadata.xml'), 'w') as f:
+            f.write("<metadata><groupId>com.example</groupId><artifactId>%s</artifactId><versioning><versions>%s</versions></versioning></metadata>"
+                    % (artifact, "".join("<version>%s</version>" % (v) for v in versions)))
+    server = HTTPRepository(root)
+    yield server
+    server.close()
+
+@pytest.fixture(scope='session')
+def release_repository(tmp_path_factory):
+    """
+    Release tarballs the way artifacts.elastic.co lays them out: product-1.0
+    with RELEASE_TREE_DIRS directories, a product-big-1.0 holding a
+    LARGE_ARTIFACT_MB file and a product-flat-1.0 without a top level
+    directory
+    """
+    if ThreadingHTTPServer is None:
+        pytest.skip("python 3.7 or later is needed for the http stand-in")
+    root = str(tmp_path_factory.mktemp('releases'))
+    build = str(tmp_path_factory.mktemp('build'))
+
+    tree = os.path.join(build, 'product-1.0')
+    make_release_tree(tree, RELEASE_TREE_DIRS)
+    make_tarball(tree, os.path.join(root, 'product-1.0.tar.gz'))
+
+    big = os.path.join(build, 'product-big-1.0')
+    os.makedirs(big)
+    write_artifact(os.path.join(big, 'blob'), LARGE_ARTIFACT_MB)
+    make_tarball(big, os.path.join(root, 'product-big-1.0.tar.gz'))
+
+    flat = os.path.join(build, 'product-flat-1.0')
+    make_release_tree(flat, 4)
+    make_tarball(flat, os.path.join(root, 'product-flat-1.0.tar.gz'), flat=True)
+
+    server = HTTPRepository(root)
+    yield server
+    server.close()
+
+@pytest.fixture
+def fake_path(monkeypatch, tmp_path):
+    """
+    Puts the fake accurev and hammer executables first in PATH, their state
+    and call log live in tmp_path
+    """
+    monkeypatch.setenv('PATH', FAKES + os.pathsep + os.environ.get('PATH', ''))
+    monkeypatch.setenv('FAKE_STATE_DIR', str(tmp_path))
+    return tmp_path
+
+def calls(fake_path, name):
+    log = os.path.join(str(fake_path), '%s.log' % (name))
+    if not os.path.isfile(log):
+        return []
+    with open(log) as f:
+        return [line.split() for line in f.read().splitlines()]
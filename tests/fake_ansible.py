@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+# In-process stand-in for the parts of ansible the library modules use, so
+# they can be run (and measured) without ansible-playbook nor a connection.
+
+import os
+import sys
+import types
+import shlex
+import shutil
+import importlib.util
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LIBRARY = os.path.join(ROOT, 'playbooks', 'library')
+MODULE_UTILS = os.path.join(ROOT, 'playbooks', 'module_utils')
+
+BOOLEANS_TRUE = ('y', 'yes', 'on', '1', 'true', 't')
+BOOLEANS_FALSE = ('n', 'no', 'off', '0', 'false', 'f')
+
+
+class ModuleExit(SystemExit):
+    # SystemExit, like the real exit_json, so "except Exception" doesn't catch it
+
+    def __init__(self, result):
+        SystemExit.__init__(self, result)
+        self.result = result
+
+
+class ModuleFail(ModuleExit):
+    pass
+
+
+class AnsibleModule(object):
+
+    # Set by run_module before the module's main() builds its AnsibleModule
+    _params = {}
+    _check_mode = False
+
+    def __init__(self, argument_spec, supports_check_mode=False, **kwargs):
+        self.argument_spec = argument_spec
+        self.check_mode = AnsibleModule._check_mode and supports_check_mode
+        if AnsibleModule._check_mode and not supports_check_mode:
+            self.exit_json(skipped=True, msg="remote module does not support check mode")
+        self.params = self._load_params(dict(AnsibleModule._params))
+
+    def _load_params(self, given):
+        params = {}
+        for name, spec in self.argument_spec.items():
+            for key in [name] + list(spec.get('aliases', [])):
+                if key in given:
+                    value = given.pop(key)
+                    break
+            else:
+                value = spec.get('default')
+            if value is None:
+                if spec.get('required'):
+                    self.fail_json(msg="missing required arguments: %s" % (name))
+                params[name] = None
+                continue
+            value = self._convert(name, value, spec.get('type', 'str'))
+            if 'choices' in spec and value not in spec['choices']:
+                self.fail_json(msg="value of %s must be one of: %s, got: %s" % (name, ", ".join(spec['choices']), value))
+            params[name] = value
+        if given:
+            self.fail_json(msg="Unsupported parameters for (%s) module: %s" % (self.__class__.__name__, ", ".join(sorted(given))))
+        return params
+
+    def _convert(self, name, value, kind):
+        if kind == 'list':
+            if isinstance(value, list):
+                return value
+            return [v.strip() for v in str(value).split(',')]
+        if kind == 'bool':
+            if isinstance(value, bool):
+                return value
+            if str(value).lower() in BOOLEANS_TRUE:
+                return True
+            if str(value).lower() in BOOLEANS_FALSE:
+                return False
+            self.fail_json(msg="%s must be a boolean, got: %s" % (name, value))
+        if kind == 'int':
+            return int(value)
+        if kind == 'path':
+            return os.path.expandvars(os.path.expanduser(str(value)))
+        if kind == 'dict':
+            if not isinstance(value, dict):
+                self.fail_json(msg="%s must be a dict, got: %s" % (name, value))
+            return value
+        return str(value)
+
+    def exit_json(self, **kwargs):
+        kwargs.setdefault('changed', False)
+        raise ModuleExit(kwargs)
+
+    def fail_json(self, **kwargs):
+        kwargs['failed'] = True
+        raise ModuleFail(kwargs)
+
+    def run_command(self, args, check_rc=False, cwd=None, data=None, **kwargs):
+        if isinstance(args, str):
+            args = shlex.split(args)
+        proc = subprocess.Popen(args, cwd=cwd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, universal_newlines=True)
+        out, err = proc.communicate(data)
+        if check_rc and proc.returncode != 0:
+            self.fail_json(cmd=args, rc=proc.returncode, stdout=out, stderr=err, msg=err.strip())
+        return (proc.returncode, out, err)
+
+    def get_bin_path(self, arg, required=False, opt_dirs=None):
+        path = shutil.which(arg)
+        if required and path is None:
+            self.fail_json(msg="Failed to find required executable %s" % (arg))
+        return path
+
+    def atomic_move(self, src, dest):
+        if os.path.exists(dest):
+            st = os.stat(dest)
+            os.chmod(src, st.st_mode & 0o7777)
+            if hasattr(os, 'chown') and os.geteuid() == 0:
+                os.chown(src, st.st_uid, st.st_gid)
+        os.rename(src, dest)
+
+
+def _package(name):
+    module = types.ModuleType(name)
+    module.__path__ = []
+    return module
+
+def install():
+    """
+    Registers the fake ansible packages, module_utils.timings is the real one
+    """
+    basic = types.ModuleType('ansible.module_utils.basic')
+    basic.AnsibleModule = AnsibleModule
+    basic.__all__ = ['AnsibleModule']
+
+    spec = importlib.util.spec_from_file_location('ansible.module_utils.timings', os.path.join(MODULE_UTILS, 'timings.py'))
+    timings = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(timings)
+
+    sys.modules['ansible'] = _package('ansible')
+    sys.modules['ansible.module_utils'] = _package('ansible.module_utils')
+    sys.modules['ansible.module_utils.basic'] = basic
+    sys.modules['ansible.module_utils.timings'] = timings
+
+def load(name):
+    spec = importlib.util.spec_from_file_location('library_%s' % (name), os.path.join(LIBRARY, name + '.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def run_module(name, params, check_mode=False):
+    """
+    Runs playbooks/library/<name>.py with params and returns its result,
+    failures are returned too (with failed=True) rather than raised
+    """
+    module = load(name)
+    AnsibleModule._params = params
+    AnsibleModule._check_mode = check_mode
+    try:
+        module.main()
+    except ModuleExit as e:
+        return e.result
+    raise AssertionError("Module (%s) returned without calling exit_json nor fail_json." % (name))
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+from conftest import calls
+
+
+def test_create_workspace(fake_path, run_module, bench, counters):
+    dest = str(fake_path / 'workspaces' / 'WS_BENCH')
+    with bench('accurev: create workspace'):
+        result = run_module('accurev', dict(dest=dest, stream='BENCH', username='bench', password='secret'))
+    assert result['changed'], result.get('msg')
+    assert [c[0] for c in calls(fake_path, 'accurev')] == ['info', 'login', 'mkws', 'update']
+    assert counters['subprocess'] == 4
+
+def test_existing_workspace_is_changed(fake_path, monkeypatch, run_module):
+    monkeypatch.setenv('FAKE_ACCUREV_LOGGED_IN', '1')
+    dest = str(fake_path / 'WS_BENCH')
+    run_module('accurev', dict(dest=dest, stream='BENCH'))
+    result = run_module('accurev', dict(dest=dest, stream='OTHER', force=True))
+    assert result['changed'], result.get('msg')
+    commands = [c[0] for c in calls(fake_path, 'accurev')]
+    assert commands == ['info', 'mkws', 'update', 'info', 'mkws', 'chws', 'update', 'pop']
+
+def test_remove_reftree(fake_path, monkeypatch, run_module):
+    monkeypatch.setenv('FAKE_ACCUREV_LOGGED_IN', '1')
+    dest = str(fake_path / 'RF_BENCH')
+    run_module('accurev', dict(dest=dest, stream='BENCH', stream_type='reftree'))
+    result = run_module('accurev', dict(dest=dest, stream_type='reftree', state='absent'))
+    assert result['changed'], result.get('msg')
+    assert calls(fake_path, 'accurev')[-1] == ['remove', 'reftree', 'RF_BENCH']
+
+def test_relative_dest(fake_path, run_module, counters):
+    result = run_module('accurev', dict(dest='WS_BENCH', stream='BENCH'))
+    assert result['failed']
+    assert counters['subprocess'] == 0
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+LINES = 2000
+
+
+@pytest.fixture
+def config(tmp_path):
+    path = str(tmp_path / 'elasticsearch.yml')
+    with open(path, 'w') as f:
+        for i in range(LINES):
+            f.write("#setting%d: default\n" % (i))
+        f.write("cluster.name: old\n")
+    return path
+
+def read(path):
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def test_single_pass(config, run_module, bench, counters):
+    lines = dict(('setting%d' % (i), dict(regexp='^setting%d:' % (i), insertafter='^#setting%d:' % (i),
+                                          line='setting%d: %d' % (i, i))) for i in range(0, LINES, 10))
+    lines['cluster.name'] = dict(regexp='^cluster.name', line='cluster.name: bench')
+
+    with bench('config_lines: %d rules over %d lines' % (len(lines), LINES)):
+        result = run_module('config_lines', dict(dest=config, lines=lines))
+    assert result['changed']
+    assert len(result['changed_keys']) == len(lines)
+    # One write, whatever the number of rules
+    assert counters['rename'] == 1
+
+    content = read(config)
+    assert content[content.index('#setting10: default') + 1] == 'setting10: 10'
+    assert content[-1] == 'cluster.name: bench'
+
+    with bench('config_lines: %d rules, no-op' % (len(lines))):
+        result = run_module('config_lines', dict(dest=config, lines=lines))
+    assert not result['changed']
+    assert counters['rename'] == 0
+
+def test_insert_order(config, run_module):
+    lines = dict(a=dict(line='a: 1', insertafter='^#setting0:'), b=dict(line='b: 1', insertafter='^#setting0:'),
+                 c=dict(line='c: 1'))
+    run_module('config_lines', dict(path=config, lines=lines))
+    content = read(config)
+    assert content[1:3] == ['a: 1', 'b: 1']
+    assert content[-1] == 'c: 1'
+
+    # The order given, not the order of the keys
+    lines = dict(z=dict(line='z: 1', insertafter='^#setting1:'), y=dict(line='y: 1', insertafter='^#setting1:'))
+    run_module('config_lines', dict(path=config, lines=lines))
+    content = read(config)
+    assert content[content.index('#setting1: default') + 1:][:2] == ['z: 1', 'y: 1']
+
+def test_check_mode(config, run_module):
+    before = read(config)
+    result = run_module('config_lines', dict(dest=config, lines=dict(x=dict(line='x: 1'))), check_mode=True)
+    assert result['changed']
+    assert read(config) == before
+
+def test_invalid_rule(config, run_module):
+    result = run_module('config_lines', dict(dest=config, lines=dict(x=dict(regexp='('))))
+    assert result['failed']
+    result = run_module('config_lines', dict(dest=config, lines=dict(x=dict(regexp='(', line='x'))))
+    assert result['failed']
+    assert 'regular expression' in result['msg']
+
+def test_missing_file(tmp_path, run_module):
+    result = run_module('config_lines', dict(dest=str(tmp_path / 'missing'), lines=dict(x=dict(line='x'))))
+    assert result['failed']
+    assert not os.path.exists(str(tmp_path / 'missing'))
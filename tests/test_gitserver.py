@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+
+import pytest
+
+PROJECTS = 200
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    path = str(tmp_path / 'upstream')
+    os.makedirs(path)
+    git = ['git', '-c', 'user.name=bench', '-c', 'user.email=bench@localhost']
+    subprocess.check_call(['git', 'init', '-q', path])
+    with open(os.path.join(path, 'README'), 'w') as f:
+        f.write('bench\n')
+    subprocess.check_call(git + ['add', 'README'], cwd=path)
+    subprocess.check_call(git + ['commit', '-q', '-m', 'Initial commit'], cwd=path)
+    subprocess.check_call(git + ['tag', 'v1'], cwd=path)
+    return path
+
+def commit(path, message):
+    git = ['git', '-c', 'user.name=bench', '-c', 'user.email=bench@localhost']
+    with open(os.path.join(path, 'README'), 'a') as f:
+        f.write(message + '\n')
+    subprocess.check_call(git + ['commit', '-q', '-a', '-m', message], cwd=path)
+
+
+def test_converge_many_projects(tmp_path, run_module, bench, counters):
+    params = dict(rootdir=str(tmp_path), projects=['project%d' % (i) for i in range(PROJECTS)])
+
+    with bench('gitserver: create %d projects' % (PROJECTS)):
+        result = run_module('gitserver', params)
+    assert result['changed']
+    assert counters['subprocess'] == PROJECTS
+
+    # Converged projects are inspected without spawning git at all
+    with bench('gitserver: no-op %d projects' % (PROJECTS)) as b:
+        result = run_module('gitserver', params)
+    assert not result['changed']
+    assert counters['subprocess'] == 0
+    assert result['timings']['count'] == 0
+    assert b.wall < 2
+
+def test_check_mode(tmp_path, run_module, counters):
+    result = run_module('gitserver', dict(rootdir=str(tmp_path), project='project'), check_mode=True)
+    assert result['changed']
+    assert not os.path.exists(str(tmp_path / 'project'))
+    assert counters['subprocess'] == 0
+
+def test_remote_is_updated(tmp_path, run_module, upstream):
+    rootdir = str(tmp_path / 'root')
+    os.makedirs(rootdir)
+    run_module('gitserver', dict(rootdir=rootdir, project='project', remote='/nowhere'))
+
+    result = run_module('gitserver', dict(rootdir=rootdir, project='project', remote=upstream))
+    assert result['changed']
+    result = run_module('gitserver', dict(rootdir=rootdir, project='project', remote=upstream))
+    assert not result['changed']
+
+def test_mirror(tmp_path, run_module, bench, counters, upstream):
+    rootdir = str(tmp_path / 'root')
+    os.makedirs(rootdir)
+    params = dict(rootdir=rootdir, projects=[dict(name='mirror%d' % (i), remote=upstream) for i in range(20)],
+                  state='mirrored', concurrency=4)
+
+    with bench('gitserver: mirror 20 projects'):
+        result = run_module('gitserver', params)
+    assert result['changed']
+    assert all(p['fetch']['bytes'] > 0 for p in result['projects'])
+
+    with bench('gitserver: up to date mirror 20 projects'):
+        result = run_module('gitserver', params)
+    assert not result['changed']
+    # Only the fetches themselves, the layout checks are done in-process
+    assert counters['subprocess'] == 20
+
+    commit(upstream, 'Second commit')
+    result = run_module('gitserver', params)
+    assert result['changed']
+    # Whatever init.defaultBranch named the upstream branch
+    branch = subprocess.check_output(['git', 'symbolic-ref', 'HEAD'], cwd=upstream).strip()
+    head = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=upstream)
+    mirrored = subprocess.check_output(['git', 'rev-parse', branch], cwd=os.path.join(rootdir, 'mirror7'))
+    assert mirrored == head
+
+def test_mirror_failure(tmp_path, run_module):
+    result = run_module('gitserver', dict(rootdir=str(tmp_path), project='broken', remote=str(tmp_path / 'missing'),
+                                          state='mirrored'))
+    assert result['failed']
+    assert 'broken' in result['msg']
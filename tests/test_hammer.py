@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+
+import pytest
+
+import fake_ansible
+
+from conftest import calls
+
+pytest.importorskip('yaml')
+
+RPMS = 20
+
+
+@pytest.fixture
+def params(fake_path):
+    rpms = fake_path / 'rpms'
+    rpms.mkdir()
+    for i in range(RPMS):
+        (rpms / ('package%d-1.0.noarch.rpm' % (i))).write_text(u'')
+    # F2E is a composite of the first published version of RHEL6
+    state = dict(next_id=10, next_task=1000, versions=dict(RHEL6=[1], F2E=[2]), components=dict(F2E=dict(RHEL6='1')))
+    (fake_path / 'hammer.json').write_text(json.dumps(state))
+    return dict(username='admin', password='secret', organization='org', product='product', name='repo',
+                rpm=[str(rpms / '*.rpm')], content_view=['RHEL6'], composite_view=['F2E'],
+                lifecycle_environment=['Dev', 'Tst', 'Acc'])
+
+
+
+def test_release(fake_path, run_module, bench, counters, params):
+    with bench('hammer: %d rpms, 3 environments' % (RPMS)):
+        result = run_module('hammer', params)
+    assert result['changed'], result.get('msg')
+    assert len(result['uploaded']) == RPMS
+    assert set(result['promoted']['F2E']) == set(['Dev', 'Tst', 'Acc'])
+
+    log = calls(fake_path, 'hammer')
+    assert log[0][:2] == ['auth', 'login']
+    # Read-only queries are cached, each is issued a single time
+    queries = [' '.join(c) for c in log if 'list' in c or 'info' in c]
+    assert len(queries) == len(set(queries))
+    assert counters['subprocess'] == len(log)
+    # One upload per rpm, the whole release flow (logout included) on top is a fixed cost
+    assert len(log) <= RPMS + 11
+
+def test_async_tasks(fake_path, run_module, bench, counters, params):
+    params['async_tasks'] = True
+    with bench('hammer: %d rpms, 3 environments, async' % (RPMS)):
+        result = run_module('hammer', params)
+    assert result['changed'], result.get('msg')
+
+    log = calls(fake_path, 'hammer')
+    submitted = [c for c in log if '--async' in c]
+    polled = [c for c in log if c[:2] == ['task', 'info']]
+    # RHEL6 and F2E publishes plus one promotion per environment
+    assert len(submitted) == 5
+    assert len(polled) == len(submitted)
+
+def test_async_promotions_follow_the_lifecycle(fake_path, run_module, params):
+    # Two views, each promoted along Dev -> Tst -> Acc
+    params.update(async_tasks=True, content_view=['RHEL6', 'RHEL7'], composite_view=[])
+    result = run_module('hammer', params)
+    assert result['changed'], result.get('msg')
+
+    log = [' '.join(c) for c in calls(fake_path, 'hammer')]
+    promotions = [(i, c.split('--to-lifecycle-environment ')[1].split(' --')[0]) for i, c in enumerate(log) if ' promote ' in c]
+    assert [env for _, env in promotions] == ['Dev', 'Dev', 'Tst', 'Tst', 'Acc', 'Acc']
+    # Both views' Dev promotions were submitted before any task was polled
+    first_poll = min(i for i, c in enumerate(log) if c.startswith('task info') and i > promotions[0][0])
+    assert promotions[1][0] < first_poll
+
+def test_task_durations_come_from_the_task(fake_path, monkeypatch, run_module, params):
+    monkeypatch.setenv('FAKE_HAMMER_TASK_SECONDS', '42')
+    params['async_tasks'] = True
+    result = run_module('hammer', params)
+    assert result['changed'], result.get('msg')
+    assert result['published']['F2E']['duration'] == 42
+    assert set(p['duration'] for p in result['promoted']['F2E'].values()) == set([42])
+
+def test_composite_gets_the_new_version(fake_path, run_module, params):
+    run_module('hammer', params)
+    first = run_module('hammer', params)
+    second = run_module('hammer', params)
+    assert second['published']['RHEL6']['version_id'] != first['published']['RHEL6']['version_id']
+    updates = [c for c in calls(fake_path, 'hammer') if c[:2] == ['content-view', 'update']]
+    assert len(updates) == 3
+
+def test_run_command_stays_on_the_main_thread(fake_path, monkeypatch, run_module, params):
+    # ansible's run_command swaps os.environ around and isn't thread safe
+    threads = set()
+    run_command = fake_ansible.AnsibleModule.run_command
+
+    def recording(module, *args, **kwargs):
+        threads.add(threading.current_thread().name)
+        return run_command(module, *args, **kwargs)
+    monkeypatch.setattr(fake_ansible.AnsibleModule, 'run_command', recording)
+
+    result = run_module('hammer', params)
+    assert result['changed'], result.get('msg')
+    assert threads == set([threading.main_thread().name])
+
+def sessions(fake_path):
+    with open(str(fake_path / 'hammer.json')) as f:
+        return json.load(f).get('sessions', 0)
+
+def test_session_is_logged_out(fake_path, run_module, params):
+    result = run_module('hammer', params)
+    assert result['changed'], result.get('msg')
+    assert calls(fake_path, 'hammer')[-1] == ['auth', 'logout']
+    assert sessions(fake_path) == 0
+
+def test_session_is_logged_out_on_failure(fake_path, run_module, params):
+    params['lifecycle_environment'] = ['Acc']
+    result = run_module('hammer', params)
+    assert result['failed']
+    assert 'out of sequence' in result['msg']
+    assert calls(fake_path, 'hammer')[-1] == ['auth', 'logout']
+    assert sessions(fake_path) == 0
+
+def test_without_sessions(fake_path, monkeypatch, run_module, params):
+    monkeypatch.setenv('FAKE_HAMMER_NO_SESSIONS', '1')
+    result = run_module('hammer', params)
+    assert result['changed'], result.get('msg')
+    assert ['auth', 'logout'] not in calls(fake_path, 'hammer')
+
+def test_missing_rpm(fake_path, run_module, params):
+    params['rpm'] = [str(fake_path / 'missing.rpm')]
+    result = run_module('hammer', params)
+    assert result['failed']
+    assert 'missing.rpm' in result['msg']
+    assert calls(fake_path, 'hammer') == []
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import os
+import hashlib
+
+import pytest
+
+from conftest import LARGE_ARTIFACT_MB
+
+pytest.importorskip('lxml')
+
+
+def md5(path):
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def test_latest_version(tmp_path, run_module, maven_repository):
+    result = run_module('maven_artifact', dict(group_id='com.example', artifact_id='small',
+                                               url_repository=maven_repository.url, dest=str(tmp_path)))
+    assert result['changed'], result.get('msg')
+    assert result['version'] == '1.1'
+    with open(result['dest'], 'rb') as f:
+        assert f.read() == b'small-1.1'
+
+def test_large_artifact_is_streamed(tmp_path, run_module, bench, maven_repository):
+    params = dict(group_id='com.example', artifact_id='large', version='2.0',
+                  url_repository=maven_repository.url, dest=str(tmp_path))
+
+    with bench('maven_artifact: download %dMiB' % (LARGE_ARTIFACT_MB), memory=True, http=maven_repository) as b:
+        result = run_module('maven_artifact', params)
+    assert result['changed'], result.get('msg')
+    jar = os.path.join(maven_repository.root, 'com', 'example', 'large', '2.0', 'large-2.0.jar')
+    assert md5(result['dest']) == md5(jar)
+    # Never more than a few chunks in memory, whatever the artifact size
+    assert b.peak_alloc < 8 * 1024 * 1024
+    if b.rss_growth is not None:
+        assert b.rss_growth < LARGE_ARTIFACT_MB * 1024 // 2
+    # The download and its checksum, over a single connection
+    assert maven_repository.count == 2
+    assert maven_repository.connections == 1
+
+    with bench('maven_artifact: up to date %dMiB' % (LARGE_ARTIFACT_MB), memory=True, http=maven_repository) as b:
+        result = run_module('maven_artifact', params)
+    assert not result['changed']
+    assert maven_repository.count == 1
+    assert b.peak_alloc < 8 * 1024 * 1024
+
+def test_corrupted_download(tmp_path, run_module, maven_repository):
+    dest = str(tmp_path / 'small.jar')
+    with open(dest, 'wb') as f:
+        f.write(b'corrupted')
+    result = run_module('maven_artifact', dict(group_id='com.example', artifact_id='small', version='1.0',
+                                               url_repository=maven_repository.url, dest=dest))
+    assert result['changed'], result.get('msg')
+    assert md5(dest) == hashlib.md5(b'small-1.0').hexdigest()
+
+def test_missing_artifact(tmp_path, run_module, maven_repository):
+    result = run_module('maven_artifact', dict(group_id='com.example', artifact_id='small', version='9.9',
+                                               url_repository=maven_repository.url, dest=str(tmp_path), retries=0))
+    assert result['failed']
+    assert '404' in result['msg']
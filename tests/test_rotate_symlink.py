@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+
+import pytest
+
+
+@pytest.fixture
+def releases(tmp_path):
+    # The lack of order is purposeful
+    for name in ('hello1', 'hello5', 'hello3', 'hello2', 'hello4'):
+        os.makedirs(str(tmp_path / name))
+        time.sleep(0.01)
+    link = str(tmp_path / 'hello')
+    os.symlink(str(tmp_path / 'hello3'), link)
+    return tmp_path
+
+def target(releases):
+    return os.path.basename(os.readlink(str(releases / 'hello')))
+
+
+@pytest.mark.parametrize('step, sort, expected', [
+    (1, 'name', 'hello4'),
+    (1, 'creation', 'hello2'),
+    (2, 'name', 'hello5'),
+    (10, 'name', 'hello5'),
+    (-1, 'name', 'hello2'),
+    (-10, 'name', 'hello1'),
+])
+def test_rotate(releases, run_module, step, sort, expected):
+    result = run_module('rotate_symlink', dict(link=str(releases / 'hello'), step=step, sort=sort))
+    assert result['changed']
+    assert target(releases) == expected
+
+def test_prune(releases, run_module):
+    result = run_module('rotate_symlink', dict(link=str(releases / 'hello'), step=1, prune=True))
+    assert target(releases) == 'hello4'
+    assert sorted(os.path.basename(d) for d in result['deleted']) == ['hello1', 'hello2', 'hello3']
+    assert not os.path.exists(str(releases / 'hello1'))
+
+def test_not_a_link(releases, run_module):
+    result = run_module('rotate_symlink', dict(link=str(releases / 'hello1')))
+    assert result['failed']
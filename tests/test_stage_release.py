@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import hashlib
+import tarfile
+
+import pytest
+
+from conftest import LARGE_ARTIFACT_MB, RELEASE_TREE_DIRS
+
+
+def params(tmp_path, repository, name):
+    dest = tmp_path / 'opt'
+    dest.mkdir(exist_ok=True)
+    return dict(url='%s/%s.tar.gz' % (repository.url, name), dest=str(dest), cache_dir=str(tmp_path / 'cache'))
+
+
+def test_stage_release_tree(tmp_path, run_module, bench, counters, release_repository):
+    args = params(tmp_path, release_repository, 'product-1.0')
+
+    with bench('stage_release: %d directories' % (RELEASE_TREE_DIRS), http=release_repository):
+        result = run_module('stage_release', args)
+    assert result['changed'], result.get('msg')
+    assert not result['cached']
+    assert os.path.isdir(os.path.join(result['path'], 'lib0', 'mod0'))
+    # The checksum and the tarball, over a single connection
+    assert release_repository.count == 2
+    assert release_repository.connections == 1
+    assert counters['subprocess'] == 0
+
+    with bench('stage_release: already staged', http=release_repository) as b:
+        result = run_module('stage_release', args)
+    assert not result['changed']
+    assert release_repository.count == 0
+    assert b.wall < 1
+
+def test_cached_tarball(tmp_path, run_module, release_repository):
+    args = params(tmp_path, release_repository, 'product-1.0')
+    run_module('stage_release', args)
+
+    # A new dest, same content address: only the checksum is fetched
+    args['dest'] = str(tmp_path / 'other')
+    os.makedirs(args['dest'])
+    release_repository.reset()
+    result = run_module('stage_release', args)
+    assert result['changed'], result.get('msg')
+    assert result['cached']
+    assert release_repository.count == 1
+
+def test_large_release_is_streamed(tmp_path, run_module, bench, release_repository):
+    args = params(tmp_path, release_repository, 'product-big-1.0')
+    with bench('stage_release: %dMiB release' % (LARGE_ARTIFACT_MB), memory=True, http=release_repository) as b:
+        result = run_module('stage_release', args)
+    assert result['changed'], result.get('msg')
+    assert os.path.getsize(os.path.join(result['path'], 'blob')) == LARGE_ARTIFACT_MB * 1024 * 1024
+    assert b.peak_alloc < 8 * 1024 * 1024
+    if b.rss_growth is not None:
+        assert b.rss_growth < LARGE_ARTIFACT_MB * 1024 // 2
+
+def test_checksum_mismatch(tmp_path, run_module, release_repository):
+    args = params(tmp_path, release_repository, 'product-1.0')
+    args['checksum_url'] = '%s/product-big-1.0.tar.gz.sha512' % (release_repository.url)
+    result = run_module('stage_release', args)
+    assert result['failed']
+    assert "doesn't match" in result['msg']
+    assert not os.path.exists(result.get('path', os.path.join(args['dest'], 'product-1.0')))
+    assert os.listdir(args['cache_dir']) == []
+
+def test_existing_install_is_adopted(tmp_path, run_module, release_repository):
+    # Extracted by unarchive before stage_release existed, data lives inside
+    args = params(tmp_path, release_repository, 'product-1.0')
+    index = os.path.join(args['dest'], 'product-1.0', 'data', 'index')
+    os.makedirs(index)
+
+    release_repository.reset()
+    result = run_module('stage_release', args)
+    assert result['changed'], result.get('msg')
+    assert result['adopted']
+    assert os.path.isdir(index)
+    assert not os.path.exists(os.path.join(args['dest'], 'product-1.0', 'lib0'))
+    # Only the checksum, recorded in the manifest
+    assert release_repository.count == 1
+
+    result = run_module('stage_release', args)
+    assert not result['changed']
+    assert os.path.isdir(index)
+
+def test_other_release_is_kept(tmp_path, run_module, release_repository):
+    args = params(tmp_path, release_repository, 'product-1.0')
+    run_module('stage_release', args)
+    index = os.path.join(args['dest'], 'product-1.0', 'data', 'index')
+    os.makedirs(index)
+
+    args['url'] = '%s/product-big-1.0.tar.gz' % (release_repository.url)
+    args['name'] = 'product-1.0'
+    result = run_module('stage_release', args)
+    assert result['failed']
+    assert 'another release' in result['msg']
+    assert os.path.isdir(index)
+
+def test_flat_tarball(tmp_path, run_module, release_repository):
+    args = params(tmp_path, release_repository, 'product-flat-1.0')
+    result = run_module('stage_release', args)
+    assert result['changed'], result.get('msg')
+    assert sorted(os.listdir(result['path'])) == ['.stage_release.json', 'lib0', 'lib1']
+    assert [e for e in os.listdir(args['dest']) if e.startswith('.')] == []
+
+@pytest.mark.parametrize('data_filter', [True, False])
+def test_hard_link_outside_of_dest(tmp_path, monkeypatch, run_module, release_repository, data_filter):
+    # A hard link's linkname is relative to the extraction root, not to the
+    # directory of the link
+    if not data_filter:
+        monkeypatch.delattr(tarfile, 'data_filter', raising=False)
+    archive = os.path.join(release_repository.root, 'product-evil-1.0.tar.gz')
+    with tarfile.open(archive, 'w:gz') as tar:
+        content = b'x'
+        member = tarfile.TarInfo('product-evil-1.0/a/b/file')
+        member.size = len(content)
+        tar.addfile(member, io.BytesIO(content))
+        member = tarfile.TarInfo('product-evil-1.0/a/b/link')
+        member.type = tarfile.LNKTYPE
+        member.linkname = 'product-evil-1.0/a/b/../../../../secret'
+        tar.addfile(member)
+    with open(archive, 'rb') as f:
+        checksum = hashlib.sha512(f.read()).hexdigest()
+    with open(archive + '.sha512', 'w') as f:
+        f.write(checksum)
+
+    args = params(tmp_path, release_repository, 'product-evil-1.0')
+    # Right next to the release, where the link leads to
+    secret = os.path.join(args['dest'], 'secret')
+    with open(secret, 'w') as f:
+        f.write('secret')
+    result = run_module('stage_release', args)
+    assert result['failed']
+    assert not os.path.exists(os.path.join(args['dest'], 'product-evil-1.0'))
+    assert 'outside' in result['msg']
+    assert os.stat(secret).st_nlink == 1
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import os
+import stat
+
+import pytest
+
+from conftest import RELEASE_TREE_DIRS, make_release_tree
+
+
+@pytest.fixture
+def tree(tmp_path):
+    path = str(tmp_path / 'release')
+    make_release_tree(path, RELEASE_TREE_DIRS)
+    return path
+
+def mode(path):
+    return stat.S_IMODE(os.lstat(path).st_mode)
+
+
+def test_walk_and_fix(tree, run_module, bench, counters):
+    os.chmod(os.path.join(tree, 'lib0'), 0o700)
+    os.chmod(os.path.join(tree, 'lib0', 'mod0', 'file0'), 0o600)
+
+    with bench('tree_permissions: fix %d directories' % (RELEASE_TREE_DIRS)) as b:
+        result = run_module('tree_permissions', dict(path=tree))
+    assert result['changed']
+    # Only the entries which are off get a syscall
+    assert result['fixed'] == 2
+    assert counters['chmod'] == 2
+    assert counters['lchown'] == 0
+    assert mode(os.path.join(tree, 'lib0')) == 0o755
+    assert mode(os.path.join(tree, 'lib0', 'mod0', 'file0')) == 0o644
+    assert b.wall < 10
+
+    with bench('tree_permissions: no-op %d directories' % (RELEASE_TREE_DIRS)):
+        result = run_module('tree_permissions', dict(path=tree))
+    assert not result['changed']
+    assert counters['chmod'] == 0
+
+def test_stamp_skips_the_walk(tree, run_module, bench, counters):
+    stamp = os.path.join(tree, '.tree_permissions')
+    result = run_module('tree_permissions', dict(path=tree, stamp=stamp))
+    assert result['scanned'] > RELEASE_TREE_DIRS
+
+    with bench('tree_permissions: stamped %d directories' % (RELEASE_TREE_DIRS)) as b:
+        result = run_module('tree_permissions', dict(path=tree, stamp=stamp))
+    assert result['skipped']
+    assert result['scanned'] == 0
+    assert b.wall < 1
+
+    # Other settings, other stamp
+    result = run_module('tree_permissions', dict(path=tree, stamp=stamp, file_mode='0640'))
+    assert result['changed']
+    assert mode(os.path.join(tree, 'lib0', 'mod0', 'file0')) == 0o640
+
+def test_check_mode(tree, run_module, counters):
+    os.chmod(os.path.join(tree, 'lib0'), 0o700)
+    counters.reset()
+    result = run_module('tree_permissions', dict(path=tree), check_mode=True)
+    assert result['changed']
+    assert counters['chmod'] == 0
+    assert mode(os.path.join(tree, 'lib0')) == 0o700
+
+def test_owner_by_id(tree, run_module, counters):
+    result = run_module('tree_permissions', dict(path=tree, owner=str(os.getuid()), group=str(os.getgid())))
+    assert not result['changed']
+    assert counters['lchown'] == 0